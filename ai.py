@@ -1,9 +1,13 @@
+import os
 import time
 import math
-import copy
-from move_validation import get_piece_moves
-from checkmate_logic import is_checkmate, is_stalemate, is_in_check
+import tablebase
 from utils import switch_turn
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from checkmate_logic import least_valuable_attacker
+from search_stats import SearchStats
+from opening_book import OpeningBook
+from pieces import EMPTY, WHITE, BLACK, PAWN, QUEEN, KING, TYPE_MASK, PIECE_LETTERS, SQUARE_POS
 
 # Piece value mapping and piece-square tables
 pieceScore = {"K": 0, "Q": -90, "R": -50, "B": -35, "N": -30, "p": -10}
@@ -63,139 +67,571 @@ blackPawnScore = [[0, 0, 0, 0, 0, 0, 0, 0],
 
 piecePosScores = {'N': knightScore, 'B': bishopScore, 'Q': queenScore, 'R': rookScore, "wp": whitePawnScore, "bp": blackPawnScore}
 
+
+def build_piece_tables():
+    # Per piece code: material and per-square positional contribution to the score
+    material = [0] * 16
+    position = [[0] * 64 for _ in range(16)]
+    for piece_type, letter in PIECE_LETTERS.items():
+        for color_bit, sign, color in ((WHITE, 1, 'w'), (BLACK, -1, 'b')):
+            piece = color_bit | piece_type
+            material[piece] = sign * pieceScore['p' if letter == 'P' else letter]
+            table = piecePosScores.get(color + 'p' if letter == 'P' else letter)
+            if table:
+                for square, (r, c) in enumerate(SQUARE_POS):
+                    position[piece][square] = sign * table[r][c]
+    return material, position
+
+MATERIAL_VALUES, POSITION_VALUES = build_piece_tables()
+
+# Exchange values by piece type; the king outweighs everything so it only ever captures last
+SEE_VALUES = [0] * 8
+for piece_type, letter in PIECE_LETTERS.items():
+    SEE_VALUES[piece_type] = -pieceScore['p' if letter == 'P' else letter]
+SEE_VALUES[KING] = 1000
+
+def see(board_obj, move):
+    # Static exchange evaluation: material the side to move wins by starting a capture
+    # sequence on the target square, each side recapturing with its cheapest piece and
+    # free to stop. No moves are made on the board.
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    start = from_row * 8 + from_col
+    end = to_row * 8 + to_col
+    squares = board_obj.squares
+    piece_type = squares[start] & TYPE_MASK
+    removed = {start}
+
+    gains = [SEE_VALUES[squares[end] & TYPE_MASK]]
+    if piece_type == PAWN:
+        if squares[end] == EMPTY and from_col != to_col:
+            # En passant: the captured pawn leaves its square, not the target
+            gains[0] = SEE_VALUES[PAWN]
+            removed.add(start & ~7 | to_col)
+        if to_row == 0 or to_row == 7:
+            gains[0] += SEE_VALUES[QUEEN] - SEE_VALUES[PAWN]
+            piece_type = QUEEN
+
+    color = 'black' if squares[start] & BLACK else 'white'
+    on_square = SEE_VALUES[piece_type]
+    while True:
+        color = switch_turn(color)
+        attacker = least_valuable_attacker(board_obj, end, color, removed)
+        if attacker is None:
+            break
+        gains.append(on_square - gains[-1])
+        on_square = SEE_VALUES[squares[attacker] & TYPE_MASK]
+        removed.add(attacker)
+
+    # Either side may decline to recapture when it would lose material
+    while len(gains) > 1:
+        last = gains.pop()
+        gains[-1] = -max(-gains[-1], last)
+    return gains[0]
+
+def evaluation_sums(squares):
+    material = 0
+    position = 0
+    for square, piece in enumerate(squares):
+        if piece != EMPTY:
+            material += MATERIAL_VALUES[piece]
+            position += POSITION_VALUES[piece][square]
+    return material, position
+
 CHECKMATE = -100000
 STALEMATE = 0
 MAX_DEPTH = 5
+AI_TIME_LIMIT = 3.0  # Seconds per AI move
+HASH_SIZE_MB = 16
+AI_WORKERS = 1  # Processes for the root search; see parallel_search
+USE_BOOK = True
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+USE_TABLEBASES = True  # Build the tables with tablebase.py
+# Table wins score below mates found by the search, sooner wins higher
+TABLEBASE_WIN = -CHECKMATE - 1000
+VERBOSE = True  # Print a summary line after every search
+STATS_HOOK = None  # Called with every search's SearchStats, e.g. search_stats.jsonl_hook(path)
+# Multipliers on the two evaluation terms, for tuning matches
+MATERIAL_WEIGHT = 1
+POSITION_WEIGHT = 1
+# Captures that cannot lift the score this far past the bound are skipped in quiescence
+DELTA_MARGIN = 20
+
+# Search features, each switchable on its own to measure its effect
+USE_PVS = True
+USE_ASPIRATION = True
+USE_NULL_MOVE = True
+USE_LMR = True
+USE_DELTA_PRUNING = True
+ASPIRATION_WINDOW = 15
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+LMR_MIN_DEPTH = 3
+# Settings for deterministic searches: everything whose effect depends on the search window
+# is off, so a move's score depends only on the position and depth
+DETERMINISTIC_SETTINGS = {'USE_NULL_MOVE': False, 'USE_LMR': False, 'USE_ASPIRATION': False,
+                          'USE_DELTA_PRUNING': False}
+
+# Transposition table shared by every search, bounded to HASH_SIZE_MB
+transposition_table = TranspositionTable(HASH_SIZE_MB)
+
+# Opened on first use; build the file with book_builder.py
+opening_book = None
+
+def load_opening_book(path=BOOK_FILE):
+    global opening_book
+    if opening_book is not None:
+        opening_book.close()
+    opening_book = OpeningBook(path) if os.path.exists(path) else None
+    return opening_book
+
+def set_hash_size(size_mb):
+    transposition_table.resize(size_mb)
 
-# Transposition table for faster evaluation
-transposition_table = {}
+def apply_settings(settings):
+    # Sets module settings by name and returns the values they replaced
+    previous = {name: globals()[name] for name in settings}
+    globals().update(settings)
+    return previous
 
 def get_all_possible_moves(board_obj, color):
-    moves = []
-    board = board_obj.board
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece.strip() and piece != '##' and piece[0].lower() == color[0].lower():
-                for r2 in range(8):
-                    for c2 in range(8):
-                        if get_piece_moves(piece, board_obj, (r, c), color, (r2, c2)):
-                            moves.append(((r, c), (r2, c2)))
-    return moves
-
-def order_moves(moves, board_obj, color):
-    scored = []
-    for move in moves:
-        temp_board = copy.deepcopy(board_obj)
-        from_pos, to_pos = move
-        moved_piece = temp_board.board[from_pos[0]][from_pos[1]]
-        captured_piece = temp_board.board[to_pos[0]][to_pos[1]]
+    return board_obj.get_all_legal_moves(color)
 
-        temp_board.move_piece(move, color)
-        score = evaluate_board(temp_board)
+# Ordering bands: table/PV move, captures and promotions, killers, then quiet moves by
+# history, with captures that lose material last
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORES = (1 << 27, (1 << 27) - 1)
+MAX_KILLER_PLY = 64
 
-        move_value = 0
-        moved_val = pieceScore.get(moved_piece[1].upper(), 0)
-        captured_val = pieceScore.get(captured_piece[1].upper(), 0) if captured_piece.strip() and captured_piece != '##' else 0
+def mvv_lva(victim, attacker):
+    # Most valuable victim first, then the least valuable attacker
+    return abs(MATERIAL_VALUES[victim]) * 16 - (attacker & TYPE_MASK)
 
-        if captured_val:
-            move_value += (captured_val - moved_val)
-        
-        if is_in_check(temp_board, switch_turn(color)):
-            move_value += 20  # Reward moves that lead to check
+def order_moves(moves, board_obj, color, state=None, ply=0, preferred=()):
+    squares = board_obj.squares
+    killers = state.killers[ply] if state is not None and ply < MAX_KILLER_PLY else ()
+    history = state.history if state is not None else None
+    scored = []
+    for move in moves:
+        (from_row, from_col), (to_row, to_col) = move[0], move[1]
+        start = from_row * 8 + from_col
+        end = to_row * 8 + to_col
+        piece = squares[start]
+        captured = squares[end]
 
-        score += move_value * (1 if color == 'w' else -1)
+        if move in preferred:
+            score = HASH_MOVE_SCORE - preferred.index(move)
+        elif captured != EMPTY:
+            score = CAPTURE_SCORE + mvv_lva(captured, piece)
+            if SEE_VALUES[captured & TYPE_MASK] < SEE_VALUES[piece & TYPE_MASK]:
+                # Only a capture of a cheaper piece can lose material
+                exchange = see(board_obj, move)
+                if exchange < 0:
+                    score = exchange
+        elif piece & TYPE_MASK == PAWN and (to_row == 0 or to_row == 7):
+            # Underpromotions go after the quiet moves
+            score = -1 if len(move) > 2 else CAPTURE_SCORE + mvv_lva(piece ^ PAWN ^ QUEEN, piece)
+        elif piece & TYPE_MASK == PAWN and end == board_obj.en_passant_target and from_col != to_col:
+            score = CAPTURE_SCORE + mvv_lva(piece ^ BLACK, piece)
+        elif move in killers:
+            score = KILLER_SCORES[killers.index(move)]
+        elif history is not None:
+            score = history[piece][end]
+        else:
+            score = 0
         scored.append((score, move))
 
-    scored.sort(reverse=(color == 'w'), key=lambda x: x[0])
+    scored.sort(key=lambda item: item[0], reverse=True)
     return [move for (_, move) in scored]
 
+def is_quiet(board_obj, move):
+    # Killers and history only learn from moves that neither capture nor promote
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    piece = board_obj.squares[from_row * 8 + from_col]
+    if board_obj.squares[to_row * 8 + to_col] != EMPTY:
+        return False
+    if piece & TYPE_MASK == PAWN and (to_row in (0, 7) or from_col != to_col):
+        return False
+    return True
+
+def record_cutoff(board_obj, move, depth, ply, state):
+    if not is_quiet(board_obj, move):
+        return
+    if ply < MAX_KILLER_PLY:
+        killers = state.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    piece = board_obj.squares[from_row * 8 + from_col]
+    state.history[piece][to_row * 8 + to_col] += depth * depth
+
+def tablebase_score(board_obj):
+    # Exact score for the side to move when the endgame tables cover the position, else None
+    if not USE_TABLEBASES or count_pieces(board_obj) > tablebase.MAX_PIECES:
+        return None
+    found = tablebase.probe(board_obj)
+    if found is None:
+        return None
+    result, distance = found
+    return result * (TABLEBASE_WIN - distance) if result else STALEMATE
+
 def evaluate_board(board_obj):
-    board_hash = str(board_obj.board)
-    if board_hash in transposition_table:
-        return transposition_table[board_hash][0]
-
-    if is_checkmate(board_obj, 'black'): return CHECKMATE
-    if is_checkmate(board_obj, 'white'): return -CHECKMATE
-    if is_stalemate(board_obj, 'white') or is_stalemate(board_obj, 'black'): return STALEMATE
-
-    score = 0
-    board = board_obj.board
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece.strip() and piece != '##':
-                piece_type = piece[1].upper()
-                color = piece[0].lower()
-                value = pieceScore.get(piece_type, 0)
-
-                key = piece_type
-                if piece_type == "P":
-                    key = piece.lower()
-                if key in piecePosScores:
-                    value += piecePosScores[key][r][c]
-
-                score += value if color == 'w' else -value
-
-    transposition_table[board_hash] = (score, None)
-    return score
-
-def minimax(board_obj, depth, alpha, beta, maximizing, color):
-    board_hash = str(board_obj.board)
-    if board_hash in transposition_table:
-        return transposition_table[board_hash]
-
-    if depth == 0:
-        return evaluate_board(board_obj), None
+    # Running sums kept by make_move; mate and stalemate are found by the search
+    score = tablebase_score(board_obj)
+    if score is not None:
+        return score if board_obj.turn == 'black' else -score
+    # Rounded, since the transposition table stores integer scores
+    return round(MATERIAL_WEIGHT * board_obj.material + POSITION_WEIGHT * board_obj.position_score)
+
+def store_result(board_hash, depth, score, alpha, beta, best_move):
+    # Scores outside the search window are only bounds on the true value
+    if score <= alpha:
+        flag = UPPER
+    elif score >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    transposition_table.store(board_hash, depth, score, flag, best_move)
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchState:
+    # Budget and bookkeeping for one call to get_ai_move
+    def __init__(self, time_limit=None, max_nodes=None, stop_event=None):
+        self.start_time = time.time()
+        self.deadline = self.start_time + time_limit if time_limit is not None else None
+        self.max_nodes = max_nodes
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.qnodes = 0
+        self.root_depth = 0
+        self.pv = []
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.iteration_nodes = []
+        # Seconds spent generating moves, ordering them and evaluating leaves
+        self.movegen_time = 0.0
+        self.ordering_time = 0.0
+        self.eval_time = 0.0
+        self.reset_heuristics()
 
+    def reset_heuristics(self):
+        # Quiet moves that caused cutoffs, two per ply, and a [piece][target] history
+        self.killers = [[None, None] for _ in range(MAX_KILLER_PLY)]
+        self.history = [[0] * 64 for _ in range(16)]
+
+    def check_limits(self):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchTimeout()
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchTimeout()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout()
+
+def capture_gain(board_obj, move):
+    # Material a capture or promotion wins, before any recapture
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    squares = board_obj.squares
+    piece = squares[from_row * 8 + from_col]
+    captured = squares[to_row * 8 + to_col]
+    gain = abs(MATERIAL_VALUES[captured])
+    if piece & TYPE_MASK == PAWN:
+        if captured == EMPTY and from_col != to_col:
+            gain = abs(MATERIAL_VALUES[piece ^ BLACK])  # En passant
+        if to_row == 0 or to_row == 7:
+            gain += abs(MATERIAL_VALUES[piece ^ PAWN ^ QUEEN]) - abs(MATERIAL_VALUES[piece])
+    return gain
+
+def quiescence(board_obj, alpha, beta, color, state):
+    # Extends a leaf with captures and promotions until the position is quiet.
+    # Scores are from the point of view of the side to move
+    state.check_limits()
+    state.qnodes += 1
+    in_check = board_obj.is_in_check(color)
+    started = time.perf_counter()
     valid_moves = get_all_possible_moves(board_obj, color)
+    state.movegen_time += time.perf_counter() - started
     if not valid_moves:
-        if is_in_check(board_obj, color):
-            return (-CHECKMATE if maximizing else CHECKMATE), None
-        return STALEMATE, None
+        return CHECKMATE if in_check else STALEMATE
 
-    valid_moves = order_moves(valid_moves, board_obj, color)
-    best_move = None
-
-    if maximizing:
-        max_score = -math.inf
-        for move in valid_moves:
-            temp_board = copy.deepcopy(board_obj)
-            temp_board.move_piece(move, color)
-            score, _ = minimax(temp_board, depth +1, alpha, beta, False, switch_turn(color))
-            if score > max_score:
-                max_score, best_move = score, move
-            alpha = max(alpha, score)
-            if beta <= alpha:
-                break
-        transposition_table[board_hash] = (max_score, best_move)
-        return max_score, best_move
+    if in_check:
+        # No standing pat in check: every evasion is searched
+        stand_pat = None
+        best_score = -math.inf
+        started = time.perf_counter()
+        moves = order_moves(valid_moves, board_obj, color)
+        state.ordering_time += time.perf_counter() - started
     else:
-        min_score = math.inf
-        for move in valid_moves:
-            temp_board = copy.deepcopy(board_obj)
-            temp_board.move_piece(move, color)
-            score, _ = minimax(temp_board, depth +1, alpha, beta, True, switch_turn(color))
-            if score < min_score:
-                min_score, best_move = score, move
-            beta = min(beta, score)
-            if beta <= alpha:
-                break
-        transposition_table[board_hash] = (min_score, best_move)
-        return min_score, best_move
+        started = time.perf_counter()
+        stand_pat = evaluate_board(board_obj)
+        state.eval_time += time.perf_counter() - started
+        if color == 'white':
+            stand_pat = -stand_pat
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        best_score = stand_pat
+        # Underpromotions are left to the main search
+        noisy = [move for move in valid_moves if len(move) == 2 and not is_quiet(board_obj, move)]
+        started = time.perf_counter()
+        moves = order_moves(noisy, board_obj, color)
+        state.ordering_time += time.perf_counter() - started
+
+    for move in moves:
+        if stand_pat is not None:
+            # Delta pruning: even winning the piece outright cannot reach alpha
+            if USE_DELTA_PRUNING and stand_pat + capture_gain(board_obj, move) + DELTA_MARGIN <= alpha:
+                continue
+            if see(board_obj, move) < 0:
+                continue
+        undo = board_obj.make_move(move)
+        try:
+            score = -quiescence(board_obj, -beta, -alpha, switch_turn(color), state)
+        finally:
+            board_obj.unmake_move(undo)
+        best_score = max(best_score, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best_score
+
+def has_non_pawn_material(board_obj, color):
+    color_bit = BLACK if color == 'black' else WHITE
+    for piece in board_obj.squares:
+        if piece != EMPTY and (piece & BLACK) == color_bit and piece & TYPE_MASK not in (PAWN, KING):
+            return True
+    return False
+
+def negamax(board_obj, depth, alpha, beta, color, state, ply=0, allow_null=True):
+    # Returns (score, best move) with the score from the side to move's point of view
+    if depth <= 0:
+        return quiescence(board_obj, alpha, beta, color, state), None
+    state.check_limits()
+    board_hash = board_obj.zobrist_key
+    entry = transposition_table.probe(board_hash)
+    tt_move = None
+    if entry:
+        entry_depth, entry_score, entry_flag, tt_move = entry
+        if entry_depth >= depth and ply > 0:
+            if entry_flag == EXACT:
+                return entry_score, tt_move
+            if entry_flag == LOWER and entry_score >= beta:
+                return entry_score, tt_move
+            if entry_flag == UPPER and entry_score <= alpha:
+                return entry_score, tt_move
+
+    if ply > 0:
+        score = tablebase_score(board_obj)
+        if score is not None:
+            return score, None
+
+    alpha_orig = alpha
+    opponent = switch_turn(color)
+    in_check = board_obj.is_in_check(color)
 
-def get_ai_move(board_obj, color):
+    # Null move: if passing still fails high the position is good enough to cut.
+    # Zugzwang makes this unsound in check and when only pawns are left
+    if (USE_NULL_MOVE and allow_null and ply > 0 and not in_check and depth >= NULL_MOVE_MIN_DEPTH
+            and beta < -CHECKMATE and has_non_pawn_material(board_obj, color)):
+        undo = board_obj.make_null_move()
+        try:
+            score, _ = negamax(board_obj, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, opponent,
+                               state, ply + 1, False)
+        finally:
+            board_obj.unmake_null_move(undo)
+        if -score >= beta:
+            return beta, None
+
+    started = time.perf_counter()
     valid_moves = get_all_possible_moves(board_obj, color)
+    state.movegen_time += time.perf_counter() - started
     if not valid_moves:
-        return None
+        return (CHECKMATE if in_check else STALEMATE), None
 
+    # The previous iteration's principal variation and the table move are tried first
+    pv_move = state.pv[ply] if ply < len(state.pv) else None
+    started = time.perf_counter()
+    valid_moves = order_moves(valid_moves, board_obj, color, state, ply, (tt_move, pv_move))
+    state.ordering_time += time.perf_counter() - started
+    killers = state.killers[ply] if ply < MAX_KILLER_PLY else ()
+    best_score = -math.inf
     best_move = None
-    start_time = time.time()
 
-    score, move = minimax(board_obj, MAX_DEPTH, -math.inf, math.inf, True, color)
-    best_move = move
-    print(f"AI Move Time: {time.time() - start_time:.2f}s")
-    return best_move
+    for index, move in enumerate(valid_moves):
+        # Late quiet moves are searched shallower first, and again in full only if they beat alpha
+        reduction = 0
+        if (USE_LMR and index >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH and not in_check
+                and move not in killers and is_quiet(board_obj, move)):
+            reduction = 1
+        undo = board_obj.make_move(move)
+        try:
+            if reduction and board_obj.is_in_check(opponent):
+                reduction = 0
+            score = None
+            if reduction:
+                score = -negamax(board_obj, depth - 1 - reduction, -alpha - 1, -alpha, opponent, state,
+                                 ply + 1)[0]
+            if score is None or score > alpha:
+                if USE_PVS and index > 0:
+                    # Later moves only need to prove they are no better than the first
+                    score = -negamax(board_obj, depth - 1, -alpha - 1, -alpha, opponent, state, ply + 1)[0]
+                    if alpha < score < beta:
+                        score = -negamax(board_obj, depth - 1, -beta, -alpha, opponent, state, ply + 1)[0]
+                else:
+                    score = -negamax(board_obj, depth - 1, -beta, -alpha, opponent, state, ply + 1)[0]
+        finally:
+            board_obj.unmake_move(undo)
+        if score > best_score:
+            best_score, best_move = score, move
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            record_cutoff(board_obj, move, depth, ply, state)
+            state.cutoffs += 1
+            state.first_move_cutoffs += index == 0
+            break
+    store_result(board_hash, depth, best_score, alpha_orig, beta, best_move)
+    return best_score, best_move
+
+def search_root(board_obj, depth, color, state, previous_score):
+    # Searches a narrow window around the previous iteration's score first and
+    # widens the side that fails
+    alpha, beta = -math.inf, math.inf
+    if USE_ASPIRATION and depth > 1 and previous_score is not None and abs(previous_score) < -CHECKMATE:
+        alpha, beta = previous_score - ASPIRATION_WINDOW, previous_score + ASPIRATION_WINDOW
+    while True:
+        score, move = negamax(board_obj, depth, alpha, beta, color, state)
+        if score <= alpha and alpha > -math.inf:
+            alpha = -math.inf
+        elif score >= beta and beta < math.inf:
+            beta = math.inf
+        else:
+            return score, move
+
+def search_root_exact(board_obj, depth, color, state):
+    # Deterministic root: every move gets a full window, an empty table and fresh
+    # killers and history, exactly as parallel_search's workers search it. Equal scores
+    # go to the first move generated
+    best_score, best_move = -math.inf, None
+    pv = state.pv
+    state.pv = []
+    try:
+        for move in get_all_possible_moves(board_obj, color):
+            transposition_table.clear()
+            state.reset_heuristics()
+            undo = board_obj.make_move(move)
+            try:
+                score = -negamax(board_obj, depth - 1, -math.inf, math.inf, switch_turn(color), state, 1)[0]
+            finally:
+                board_obj.unmake_move(undo)
+            if score > best_score:
+                best_score, best_move = score, move
+    finally:
+        state.pv = pv
+    return best_score, best_move
+
+def extract_pv(board_obj, color, max_length):
+    # Follows the table's best moves from the current position
+    pv = []
+    undos = []
+    seen = set()
+    while len(pv) < max_length and board_obj.zobrist_key not in seen:
+        seen.add(board_obj.zobrist_key)
+        entry = transposition_table.probe(board_obj.zobrist_key)
+        if not entry or entry[3] not in get_all_possible_moves(board_obj, color):
+            break
+        pv.append(entry[3])
+        undos.append(board_obj.make_move(entry[3]))
+        color = switch_turn(color)
+    for undo in reversed(undos):
+        board_obj.unmake_move(undo)
+    return pv
+
+def get_ai_move(board_obj, color, time_limit=AI_TIME_LIMIT, max_nodes=None, max_depth=MAX_DEPTH,
+                stop_event=None, workers=AI_WORKERS, return_stats=False, stats_hook=None, progress_hook=None,
+                deterministic=False):
+    # Returns the move, or (move, SearchStats) with return_stats. stats_hook, or
+    # STATS_HOOK when not given, is called with the stats of every search, and
+    # progress_hook with the stats so far after every completed iteration.
+    # deterministic searches with DETERMINISTIC_SETTINGS and search_root_exact, so any
+    # number of workers returns the same move at a fixed depth
+    move = None
+    if USE_BOOK and (opening_book is not None or load_opening_book() is not None):
+        move = opening_book.choose(board_obj, color)
+        source = 'book'
+    if move is None and USE_TABLEBASES and count_pieces(board_obj) <= tablebase.MAX_PIECES:
+        move = tablebase.best_move(board_obj)
+        source = 'tablebase'
+    if move is not None:
+        transposition_table.reset_counters()
+        score = tablebase_score(board_obj) if source == 'tablebase' else None
+        stats = SearchStats(SearchState(), transposition_table, move, score, 0, 0.0)
+        if VERBOSE:
+            print(f"AI Move Time: 0.00s ({source})")
+        hook = stats_hook or STATS_HOOK
+        if hook is not None:
+            hook(stats)
+        return (move, stats) if return_stats else move
+
+    if workers != 1:
+        # Imported here because parallel_search needs Board, which imports this module
+        from parallel_search import get_parallel_move
+        move, stats = get_parallel_move(board_obj, color, workers, time_limit, max_depth, deterministic,
+                                        True, progress_hook, max_nodes, stop_event)
+        hook = stats_hook or STATS_HOOK
+        if hook is not None:
+            hook(stats)
+        return (move, stats) if return_stats else move
+
+    valid_moves = get_all_possible_moves(board_obj, color)
+    # Fall back to a legal move if not even depth 1 finishes in time
+    best_move = valid_moves[0] if valid_moves else None
+    state = SearchState(time_limit, max_nodes, stop_event)
+    transposition_table.new_search()
+    transposition_table.reset_counters()
+
+    # Iterative deepening: keep the move of the last fully searched depth
+    completed_depth = 0
+    score = None
+    best_score = None
+    previous_settings = apply_settings(DETERMINISTIC_SETTINGS) if deterministic else {}
+    try:
+        for depth in range(1, max_depth + 1 if valid_moves else 1):
+            state.root_depth = depth
+            nodes_before = state.nodes
+            try:
+                if deterministic:
+                    score, move = search_root_exact(board_obj, depth, color, state)
+                else:
+                    score, move = search_root(board_obj, depth, color, state, score)
+            except SearchTimeout:
+                break
+            if move is not None:
+                best_move = move
+            best_score = score
+            completed_depth = depth
+            state.iteration_nodes.append(state.nodes - nodes_before)
+            # The exact root leaves only the last move's subtree in the table
+            state.pv = [best_move] if deterministic else extract_pv(board_obj, color, depth)
+            if progress_hook is not None:
+                progress_hook(SearchStats(state, transposition_table, best_move, score, depth,
+                                          time.time() - state.start_time))
+            if abs(score) >= abs(CHECKMATE):
+                break
+    finally:
+        apply_settings(previous_settings)
+
+    stats = SearchStats(state, transposition_table, best_move, best_score, completed_depth,
+                        time.time() - state.start_time)
+    if valid_moves and VERBOSE:
+        print(stats.summary())
+    hook = stats_hook or STATS_HOOK
+    if hook is not None:
+        hook(stats)
+    return (best_move, stats) if return_stats else best_move
 
 def count_pieces(board_obj):
-    return sum(1 for row in board_obj.board for piece in row if piece.strip() and piece != '##')
+    return 64 - board_obj.squares.count(EMPTY)
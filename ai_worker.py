@@ -0,0 +1,85 @@
+import threading
+
+from board import Board
+from ai import AI_TIME_LIMIT, get_ai_move, extract_pv
+
+
+class SearchWorker:
+    # Runs get_ai_move on a background thread so the caller's loop keeps running.
+    # Searches work on a copy, so the caller's board can be drawn and moved meanwhile
+    def __init__(self):
+        self.thread = None
+        self.stop_event = None
+        self.cancelled = None  # Set when the running search's result is to be thrown away
+        self.timer = None  # Ends a ponder search once its guess is confirmed
+        self.result = None
+        self.expected_move = None  # Reply the ponder search assumes
+        self.pondering = False
+
+    @property
+    def busy(self):
+        return self.thread is not None and not self.pondering
+
+    def run(self, board_obj, color, time_limit):
+        move = get_ai_move(board_obj, color, time_limit, stop_event=self.stop_event)
+        if not self.cancelled.is_set():
+            self.result = move
+
+    def launch(self, board_obj, color, time_limit):
+        self.stop_event = threading.Event()
+        self.cancelled = threading.Event()
+        self.result = None
+        self.thread = threading.Thread(target=self.run, args=(board_obj, color, time_limit),
+                                       daemon=True)
+        self.thread.start()
+
+    def start(self, board_obj, color, time_limit=AI_TIME_LIMIT):
+        self.cancel()
+        self.launch(Board.decode(board_obj.encode()), color, time_limit)
+
+    def poll(self):
+        # The finished search's move, once; None while it is still running
+        if self.busy and not self.thread.is_alive():
+            self.thread = None
+            return self.result
+        return None
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.thread is not None:
+            self.cancelled.set()
+            self.stop_event.set()
+            self.thread.join()
+        self.thread = None
+        self.pondering = False
+        self.expected_move = None
+
+    def ponder(self, board_obj, color):
+        # Guesses the opponent's reply from the last search and searches our answer to it
+        # without a time limit until the opponent moves
+        opponent = 'white' if color == 'black' else 'black'
+        board_copy = Board.decode(board_obj.encode())
+        expected = extract_pv(board_copy, opponent, 1)
+        self.cancel()
+        if not expected:
+            return
+        board_copy.make_move(expected[0])
+        self.launch(board_copy, color, None)
+        self.pondering = True
+        self.expected_move = expected[0]
+
+    def opponent_moved(self, board_obj, move, color, time_limit=AI_TIME_LIMIT):
+        # Starts the search for our reply. On a correct guess the ponder search becomes
+        # that search: a finished one answers at once and a running one goes on until
+        # time_limit from now. Otherwise the new search starts from the table it filled
+        if self.pondering and move == self.expected_move:
+            self.pondering = False
+            self.expected_move = None
+            if self.thread.is_alive() and time_limit is not None:
+                self.timer = threading.Timer(time_limit, self.stop_event.set)
+                self.timer.daemon = True
+                self.timer.start()
+            return
+        self.start(board_obj, color, time_limit)
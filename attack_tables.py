@@ -0,0 +1,53 @@
+from pieces import BISHOP, ROOK, QUEEN, WHITE, BLACK, SQUARE_POS
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+
+def build_offset_table(offsets):
+    table = []
+    for row, col in SQUARE_POS:
+        table.append(tuple((row + d_row) * 8 + col + d_col for d_row, d_col in offsets
+                           if 0 <= row + d_row < 8 and 0 <= col + d_col < 8))
+    return tuple(table)
+
+
+def build_ray_table(directions):
+    table = []
+    for row, col in SQUARE_POS:
+        rays = []
+        for d_row, d_col in directions:
+            ray = []
+            end_row, end_col = row + d_row, col + d_col
+            while 0 <= end_row < 8 and 0 <= end_col < 8:
+                ray.append(end_row * 8 + end_col)
+                end_row += d_row
+                end_col += d_col
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+# Precomputed target squares for every origin square
+KNIGHT_TARGETS = build_offset_table(KNIGHT_OFFSETS)
+KING_TARGETS = build_offset_table(KING_OFFSETS)
+ROOK_RAYS = build_ray_table(ROOK_DIRECTIONS)
+BISHOP_RAYS = build_ray_table(BISHOP_DIRECTIONS)
+QUEEN_RAYS = build_ray_table(QUEEN_DIRECTIONS)
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+
+
+def build_pawn_attacker_table(direction):
+    # Squares a pawn moving in the given row direction must stand on to attack each square
+    table = []
+    for row, col in SQUARE_POS:
+        table.append(tuple((row - direction) * 8 + col + d_col for d_col in (-1, 1)
+                           if 0 <= row - direction < 8 and 0 <= col + d_col < 8))
+    return tuple(table)
+
+
+PAWN_ATTACKER_SQUARES = {WHITE: build_pawn_attacker_table(-1), BLACK: build_pawn_attacker_table(1)}
@@ -0,0 +1,355 @@
+import random
+from board import Board
+from checkmate_logic import is_in_check as board_is_in_check
+from move_logic import make_move, unmake_move
+from move_generation import add_moves
+from attack_tables import KNIGHT_TARGETS, KING_TARGETS
+from pieces import (EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK, TYPE_MASK,
+                    COLOR_BITS, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE,
+                    SQUARE_POS)
+
+# Bit n of every set stands for square index n (row * 8 + col, a8 is bit 0)
+KNIGHT_ATTACKS = tuple(sum(1 << target for target in targets) for targets in KNIGHT_TARGETS)
+KING_ATTACKS = tuple(sum(1 << target for target in targets) for targets in KING_TARGETS)
+
+
+def build_pawn_attacks(direction):
+    table = []
+    for row, col in SQUARE_POS:
+        attacks = 0
+        for d_col in (-1, 1):
+            if 0 <= row + direction < 8 and 0 <= col + d_col < 8:
+                attacks |= 1 << ((row + direction) * 8 + col + d_col)
+        table.append(attacks)
+    return tuple(table)
+
+
+# Squares attacked by a pawn of the given colour standing on each square
+PAWN_ATTACKS = {WHITE: build_pawn_attacks(-1), BLACK: build_pawn_attacks(1)}
+
+
+def build_ray_masks(d_row, d_col):
+    table = []
+    for row, col in SQUARE_POS:
+        mask = 0
+        end_row, end_col = row + d_row, col + d_col
+        while 0 <= end_row < 8 and 0 <= end_col < 8:
+            mask |= 1 << (end_row * 8 + end_col)
+            end_row += d_row
+            end_col += d_col
+        table.append(mask)
+    return tuple(table)
+
+
+# (ray masks, True if the ray runs towards higher square indices)
+ROOK_RAY_MASKS = tuple((build_ray_masks(d_row, d_col), d_row * 8 + d_col > 0)
+                       for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)))
+BISHOP_RAY_MASKS = tuple((build_ray_masks(d_row, d_col), d_row * 8 + d_col > 0)
+                         for d_row, d_col in ((-1, -1), (-1, 1), (1, -1), (1, 1)))
+
+# (rights flag, squares that must be empty, squares the king stands on, crosses and
+# lands on, king target)
+CASTLING_PATHS = {
+    WHITE: ((WHITE_KINGSIDE, (1 << 61) | (1 << 62), (60, 61, 62), 62),
+            (WHITE_QUEENSIDE, (1 << 59) | (1 << 58) | (1 << 57), (60, 59, 58), 58)),
+    BLACK: ((BLACK_KINGSIDE, (1 << 5) | (1 << 6), (4, 5, 6), 6),
+            (BLACK_QUEENSIDE, (1 << 3) | (1 << 2) | (1 << 1), (4, 3, 2), 2)),
+}
+
+
+def sliding_attacks(square, occupied, ray_masks):
+    # Classical ray lookup: cut every ray at its first blocker
+    attacks = 0
+    for table, positive in ray_masks:
+        ray = table[square]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def iter_squares(bits):
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+def build_between_masks():
+    # BETWEEN[a][b] holds the squares strictly between two squares on a common line
+    table = [[0] * 64 for _ in range(64)]
+    for masks, _ in ROOK_RAY_MASKS + BISHOP_RAY_MASKS:
+        for start in range(64):
+            for end in iter_squares(masks[start]):
+                # The ray beyond `end` in the same direction is end's own ray
+                table[start][end] = masks[start] & ~masks[end] & ~(1 << end)
+    return table
+
+
+BETWEEN = build_between_masks()
+ROOK_LINES = tuple(sliding_attacks(square, 0, ROOK_RAY_MASKS) for square in range(64))
+BISHOP_LINES = tuple(sliding_attacks(square, 0, BISHOP_RAY_MASKS) for square in range(64))
+
+
+class BitBoard(Board):
+    # Board backend that keeps one 64-bit set per piece code next to the mailbox squares
+    __slots__ = ('pieces', 'occupancy')
+
+    def __init__(self):
+        super().__init__()
+        self.sync_bitboards()
+
+    @classmethod
+    def from_board(cls, board_obj):
+        bitboard = cls()
+        bitboard.squares = bytearray(board_obj.squares)
+        bitboard.castling_rights = board_obj.castling_rights
+        bitboard.en_passant_target = board_obj.en_passant_target
+        bitboard.turn = board_obj.turn
+        bitboard.halfmove_clock = board_obj.halfmove_clock
+        bitboard.fullmove_number = board_obj.fullmove_number
+        bitboard.zobrist_key = board_obj.zobrist_key
+        bitboard.king_squares = list(board_obj.king_squares)
+        bitboard.material = board_obj.material
+        bitboard.position_score = board_obj.position_score
+        bitboard.position_counts = {bitboard.zobrist_key: 1}
+        bitboard.sync_bitboards()
+        return bitboard
+
+    def set_position(self, squares, castling_rights, en_passant_target, turn, halfmove_clock=0, fullmove_number=1):
+        super().set_position(squares, castling_rights, en_passant_target, turn, halfmove_clock, fullmove_number)
+        self.sync_bitboards()
+
+    def sync_bitboards(self):
+        self.pieces = [0] * 16
+        self.occupancy = [0, 0]
+        for square, piece in enumerate(self.squares):
+            if piece != EMPTY:
+                self.toggle_piece(piece, square)
+
+    def toggle_piece(self, piece, square):
+        bit = 1 << square
+        self.pieces[piece] ^= bit
+        self.occupancy[piece >> 3] ^= bit
+
+    def toggle_move_bits(self, undo):
+        # Every change a move makes is a bit flip, so this both applies and reverts it
+        start, end, piece = undo.start, undo.end, undo.piece
+        self.toggle_piece(piece, start)
+        self.toggle_piece(undo.promoted or piece, end)
+        if undo.captured != EMPTY:
+            self.toggle_piece(undo.captured, undo.captured_square)
+        if piece & TYPE_MASK == KING and abs(end - start) == 2:
+            rook = (piece & BLACK) | ROOK
+            if end > start:
+                self.toggle_piece(rook, start + 3)
+                self.toggle_piece(rook, start + 1)
+            else:
+                self.toggle_piece(rook, start - 4)
+                self.toggle_piece(rook, start - 1)
+
+    def make_move(self, move):
+        undo = make_move(self, move)
+        self.toggle_move_bits(undo)
+        return undo
+
+    def unmake_move(self, undo):
+        self.toggle_move_bits(undo)
+        unmake_move(self, undo)
+
+    def is_square_attacked(self, square, by_color):
+        return self.is_square_attacked_by(square, COLOR_BITS[by_color],
+                                          self.occupancy[0] | self.occupancy[1])
+
+    def is_square_attacked_by(self, square, by_color_bit, occupied):
+        pieces = self.pieces
+        if KNIGHT_ATTACKS[square] & pieces[by_color_bit | KNIGHT]:
+            return True
+        if KING_ATTACKS[square] & pieces[by_color_bit | KING]:
+            return True
+        # A pawn attacks the square if a pawn of the other colour there would attack it back
+        if PAWN_ATTACKS[by_color_bit ^ BLACK][square] & pieces[by_color_bit | PAWN]:
+            return True
+        diagonal = pieces[by_color_bit | BISHOP] | pieces[by_color_bit | QUEEN]
+        if diagonal and sliding_attacks(square, occupied, BISHOP_RAY_MASKS) & diagonal:
+            return True
+        straight = pieces[by_color_bit | ROOK] | pieces[by_color_bit | QUEEN]
+        if straight and sliding_attacks(square, occupied, ROOK_RAY_MASKS) & straight:
+            return True
+        return False
+
+    def is_in_check(self, color):
+        king_square = self.king_squares[COLOR_BITS[color] >> 3]
+        if king_square < 0:
+            return False
+        return self.is_square_attacked(king_square, 'black' if color == 'white' else 'white')
+
+    def get_piece_targets(self, square, piece, color_bit):
+        own = self.occupancy[color_bit >> 3]
+        enemy = self.occupancy[(color_bit >> 3) ^ 1]
+        piece_type = piece & TYPE_MASK
+
+        if piece_type == PAWN:
+            occupied = own | enemy
+            direction = -8 if color_bit == WHITE else 8
+            targets = 0
+            one_step = square + direction
+            if not occupied & (1 << one_step):
+                targets |= 1 << one_step
+                two_step = one_step + direction
+                start_row = 6 if color_bit == WHITE else 1
+                if square >> 3 == start_row and not occupied & (1 << two_step):
+                    targets |= 1 << two_step
+            capturable = enemy
+            if self.en_passant_target is not None:
+                capturable |= 1 << self.en_passant_target
+            return targets | (PAWN_ATTACKS[color_bit][square] & capturable)
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square] & ~own
+        if piece_type == BISHOP:
+            return sliding_attacks(square, own | enemy, BISHOP_RAY_MASKS) & ~own
+        if piece_type == ROOK:
+            return sliding_attacks(square, own | enemy, ROOK_RAY_MASKS) & ~own
+        if piece_type == QUEEN:
+            return (sliding_attacks(square, own | enemy, BISHOP_RAY_MASKS) |
+                    sliding_attacks(square, own | enemy, ROOK_RAY_MASKS)) & ~own
+        return (KING_ATTACKS[square] & ~own) | self.get_castling_targets(color_bit, own | enemy)
+
+    def get_castling_targets(self, color_bit, occupied):
+        targets = 0
+        for flag, between, king_path, end in CASTLING_PATHS[color_bit]:
+            if not self.castling_rights & flag or occupied & between:
+                continue
+            if self.squares[king_path[0]] != color_bit | KING:
+                continue
+            opponent = 'white' if color_bit else 'black'
+            if any(self.is_square_attacked(square, opponent) for square in king_path):
+                continue
+            targets |= 1 << end
+        return targets
+
+    def get_checks_and_pins(self, color_bit):
+        # Returns the set of checkers, the squares that answer a single check and
+        # a pin ray mask for every pinned piece
+        pieces = self.pieces
+        enemy_bit = color_bit ^ BLACK
+        king = self.king_squares[color_bit >> 3]
+        own = self.occupancy[color_bit >> 3]
+        occupied = own | self.occupancy[enemy_bit >> 3]
+
+        checkers = ((KNIGHT_ATTACKS[king] & pieces[enemy_bit | KNIGHT]) |
+                    (PAWN_ATTACKS[color_bit][king] & pieces[enemy_bit | PAWN]))
+        pins = {}
+        queens = pieces[enemy_bit | QUEEN]
+        sliders = ((ROOK_LINES[king] & (pieces[enemy_bit | ROOK] | queens)) |
+                   (BISHOP_LINES[king] & (pieces[enemy_bit | BISHOP] | queens)))
+        for slider in iter_squares(sliders):
+            blockers = BETWEEN[king][slider] & occupied
+            if not blockers:
+                checkers |= 1 << slider
+            elif blockers & (blockers - 1) == 0 and blockers & own:
+                pins[blockers.bit_length() - 1] = BETWEEN[king][slider] | (1 << slider)
+
+        check_mask = -1
+        if checkers:
+            checker = checkers.bit_length() - 1
+            check_mask = BETWEEN[king][checker] | checkers
+        return checkers, check_mask, pins
+
+    def get_all_legal_moves(self, color):
+        color_bit = COLOR_BITS[color]
+        king = self.king_squares[color_bit >> 3]
+        if king < 0:
+            moves = []
+            for square in iter_squares(self.occupancy[color_bit >> 3]):
+                piece = self.squares[square]
+                add_moves(moves, SQUARE_POS[square], piece,
+                          iter_squares(self.get_piece_targets(square, piece, color_bit)))
+            return moves
+
+        checkers, check_mask, pins = self.get_checks_and_pins(color_bit)
+        double_check = checkers & (checkers - 1)
+        own = self.occupancy[color_bit >> 3]
+        occupied_without_king = (own | self.occupancy[(color_bit >> 3) ^ 1]) & ~(1 << king)
+        en_passant = self.en_passant_target
+        moves = []
+        for square in iter_squares(own):
+            start_pos = SQUARE_POS[square]
+            piece = self.squares[square]
+            if square == king:
+                targets = 0
+                for end in iter_squares(KING_ATTACKS[king] & ~own):
+                    if not self.is_square_attacked_by(end, color_bit ^ BLACK, occupied_without_king):
+                        targets |= 1 << end
+                if not checkers:
+                    targets |= self.get_castling_targets(color_bit, occupied_without_king | (1 << king))
+            elif double_check:
+                continue
+            else:
+                targets = self.get_piece_targets(square, piece, color_bit)
+                if en_passant is not None and piece & TYPE_MASK == PAWN and targets & (1 << en_passant):
+                    # En passant lifts two pawns off one rank, which masks cannot see
+                    targets &= ~(1 << en_passant)
+                    move = (start_pos, SQUARE_POS[en_passant])
+                    undo = self.make_move(move)
+                    if not self.is_in_check(color):
+                        targets_en_passant = 1 << en_passant
+                    else:
+                        targets_en_passant = 0
+                    self.unmake_move(undo)
+                    targets = (targets & check_mask & pins.get(square, -1)) | targets_en_passant
+                else:
+                    targets &= check_mask & pins.get(square, -1)
+            add_moves(moves, start_pos, piece, iter_squares(targets))
+        return moves
+
+
+def verify_against_board(games=50, max_plies=200, seed=0):
+    # Plays random games on both backends and checks they agree at every ply
+    rng = random.Random(seed)
+    counts = {'positions': 0, 'castling': 0, 'en_passant': 0, 'promotion': 0}
+    for _ in range(games):
+        board_obj = Board()
+        bitboard = BitBoard()
+        color = 'white'
+        for _ in range(max_plies):
+            expected = board_obj.get_all_legal_moves(color)
+            moves = bitboard.get_all_legal_moves(color)
+            assert moves == expected, (bytes(board_obj.squares), color)
+            for side in ('white', 'black'):
+                assert bitboard.is_in_check(side) == board_is_in_check(board_obj, side)
+            counts['positions'] += 1
+            if not moves:
+                break
+
+            # Favour the special moves so the corpus keeps hitting them
+            special = {}
+            for move in moves:
+                start, end = move[0][0] * 8 + move[0][1], move[1][0] * 8 + move[1][1]
+                piece_type = board_obj.squares[start] & TYPE_MASK
+                if piece_type == KING and abs(end - start) == 2:
+                    special[move] = 'castling'
+                elif piece_type == PAWN and end == board_obj.en_passant_target:
+                    special[move] = 'en_passant'
+                elif piece_type == PAWN and (end < 8 or end >= 56):
+                    special[move] = 'promotion'
+            if special and rng.random() < 0.5:
+                move = rng.choice(sorted(special))
+                counts[special[move]] += 1
+            else:
+                move = rng.choice(moves)
+
+            assert board_obj.move_piece(move, color)
+            assert bitboard.move_piece(move, color)
+            assert bitboard.squares == board_obj.squares
+            color = 'black' if color == 'white' else 'white'
+    return counts
+
+
+if __name__ == "__main__":
+    print(verify_against_board())
@@ -1,45 +1,207 @@
-from move_logic import handle_move
+from move_logic import (handle_move, make_move, unmake_move, make_null_move, unmake_null_move, undo_move,
+                        redo_move)
+from move_generation import generate_legal_moves
+from checkmate_logic import is_in_check, is_square_attacked, get_game_status
+from zobrist import compute_key
+from notation import move_to_san, san_to_move
+from ai import evaluation_sums
+from pieces import (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK, ALL_CASTLING, WHITE_KINGSIDE,
+                    WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, TYPE_MASK, PIECE_NAMES, PIECE_CODES,
+                    PIECE_LETTERS, empty_square_name)
+
+BACK_RANK = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+STATUS_CACHE_SIZE = 256  # Positions whose game status is kept
+
+
+class BoardView:
+    # Read-only 8x8 grid of two-character names ('wK', '  ', '##') over Board.squares
+    __slots__ = ('squares',)
+
+    def __init__(self, squares):
+        self.squares = squares
+
+    def __getitem__(self, row):
+        squares = self.squares
+        return tuple(PIECE_NAMES[squares[square]] if squares[square] else empty_square_name(square)
+                     for square in range(row * 8, row * 8 + 8))
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        for row in range(8):
+            yield self[row]
+
 
 class Board:
+    __slots__ = ('squares', 'history', 'castling_rights', 'en_passant_target', 'turn',
+                 'zobrist_key', 'king_squares', 'material', 'position_score', 'status_cache',
+                 'redo_stack', 'position_counts', 'halfmove_clock', 'fullmove_number')
+
     def __init__(self):
-        self.board = self.create_initial_board()
-        self.history = []
-        self.en_passant_target = None
-        self.castling_rights = {
-            'white': {'K': True, 'Q': True},
-            'black': {'K': True, 'Q': True}
-        }
-        self.en_passant_target = None  # Set to (row, col) if en passant is possible
+        self.squares = self.create_initial_board()
+        self.history = []  # Undo records of the moves played, oldest first
+        self.redo_stack = []
+        self.castling_rights = ALL_CASTLING
+        self.en_passant_target = None  # Set to a square index if en passant is possible
+        self.turn = 'white'
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.zobrist_key = compute_key(self)
+        self.king_squares = self.locate_kings()
+        # Evaluation terms, positive when black is better
+        self.material, self.position_score = evaluation_sums(self.squares)
+        self.status_cache = {}
+        # Times each position has occurred in the game, for threefold repetition
+        self.position_counts = {self.zobrist_key: 1}
 
     def create_initial_board(self):
-        return [
-            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
-            ['bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP'],
-            ['  ', '##', '  ', '##', '  ', '##', '  ', '##'],
-            ['##', '  ', '##', '  ', '##', '  ', '##', '  '],
-            ['  ', '##', '  ', '##', '  ', '##', '  ', '##'],
-            ['##', '  ', '##', '  ', '##', '  ', '##', '  '],
-            ['wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP'],
-            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
-        ]
+        squares = bytearray(64)
+        for col in range(8):
+            squares[col] = BLACK | BACK_RANK[col]
+            squares[8 + col] = BLACK | PAWN
+            squares[48 + col] = WHITE | PAWN
+            squares[56 + col] = WHITE | BACK_RANK[col]
+        return squares
+
+    def encode(self):
+        # 67 bytes: the squares, castling rights, en passant square (64 for none) and side to move
+        en_passant = 64 if self.en_passant_target is None else self.en_passant_target
+        return bytes(self.squares) + bytes((self.castling_rights, en_passant, self.turn == 'black'))
+
+    @classmethod
+    def decode(cls, data):
+        board_obj = cls()
+        board_obj.set_position(bytearray(data[:64]), data[64], None if data[65] == 64 else data[65],
+                               'black' if data[66] else 'white')
+        return board_obj
+
+    @classmethod
+    def from_fen(cls, fen):
+        # Placement, side to move, castling, en passant and the two move counters; missing
+        # counters start at 0 and 1
+        fields = fen.split()
+        squares = bytearray(64)
+        square = 0
+        for char in fields[0]:
+            if char.isdigit():
+                square += int(char)
+            elif char != '/':
+                squares[square] = PIECE_CODES[('w' if char.isupper() else 'b') + char.upper()]
+                square += 1
+        castling_rights = 0
+        for char, flag in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if len(fields) > 2 and char in fields[2]:
+                castling_rights |= flag
+        en_passant = None
+        if len(fields) > 3 and fields[3] != '-':
+            en_passant = (8 - int(fields[3][1])) * 8 + ord(fields[3][0]) - ord('a')
+        board_obj = cls()
+        board_obj.set_position(squares, castling_rights, en_passant,
+                               'black' if len(fields) > 1 and fields[1] == 'b' else 'white',
+                               int(fields[4]) if len(fields) > 4 else 0, int(fields[5]) if len(fields) > 5 else 1)
+        return board_obj
+
+    def to_fen(self):
+        # All six fields, so the two round-trip
+        rows = []
+        for row in range(8):
+            text = ''
+            empty = 0
+            for piece in self.squares[row * 8:row * 8 + 8]:
+                if piece:
+                    letter = PIECE_LETTERS[piece & TYPE_MASK]
+                    text += (str(empty) if empty else '') + (letter.lower() if piece & BLACK else letter)
+                    empty = 0
+                else:
+                    empty += 1
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(char for char, flag in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE,
+                                                               BLACK_QUEENSIDE))
+                           if self.castling_rights & flag) or '-'
+        en_passant = '-'
+        if self.en_passant_target is not None:
+            row, col = divmod(self.en_passant_target, 8)
+            en_passant = chr(col + ord('a')) + str(8 - row)
+        return (f"{'/'.join(rows)} {self.turn[0]} {castling} {en_passant} {self.halfmove_clock} "
+                f"{self.fullmove_number}")
+
+    def set_position(self, squares, castling_rights, en_passant_target, turn, halfmove_clock=0, fullmove_number=1):
+        # Replaces the position and everything derived from it; the game log starts over
+        self.squares = squares
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.turn = turn
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.zobrist_key = compute_key(self)
+        self.king_squares = self.locate_kings()
+        self.material, self.position_score = evaluation_sums(self.squares)
+        self.history = []
+        self.redo_stack = []
+        self.status_cache = {}
+        self.position_counts = {self.zobrist_key: 1}
+
+    def locate_kings(self):
+        # Indexed by colour bit >> 3; -1 when that king is missing
+        return [self.squares.find(WHITE | KING), self.squares.find(BLACK | KING)]
+
+    @property
+    def board(self):
+        return BoardView(self.squares)
 
     def move_piece(self, move, color):
         return handle_move(self, move, color)
 
+    def undo(self):
+        return undo_move(self)
+
+    def redo(self):
+        return redo_move(self)
+
+    def san(self, move):
+        return move_to_san(self, move)
+
+    def parse_san(self, text):
+        return san_to_move(self, text)
+
+    def is_threefold_repetition(self):
+        return self.position_counts.get(self.zobrist_key, 0) >= 3
+
+    def make_move(self, move):
+        return make_move(self, move)
+
+    def unmake_move(self, undo):
+        unmake_move(self, undo)
+
+    def make_null_move(self):
+        return make_null_move(self)
+
+    def unmake_null_move(self, undo):
+        unmake_null_move(self, undo)
+
     def get_all_legal_moves(self, color):
-        from move_logic import get_piece_moves
-        legal_moves = []
-        for start_row in range(8):
-            for start_col in range(8):
-                piece = self.board[start_row][start_col]
-                if piece.strip() == '' or piece == '##':
-                    continue
-                if piece[0].lower() != color[0].lower():
-                    continue
-                for end_row in range(8):
-                    for end_col in range(8):
-                        start_pos = (start_row, start_col)
-                        end_pos = (end_row, end_col)
-                        if get_piece_moves(piece, self, start_pos, color, end_pos):
-                            legal_moves.append((start_pos, end_pos))
-        return legal_moves
+        return generate_legal_moves(self, color)
+
+    def is_in_check(self, color):
+        return is_in_check(self, color)
+
+    def status(self):
+        # Check, mate, stalemate and legal moves for the side to move, computed once per position
+        status = self.status_cache.get(self.zobrist_key)
+        if status is None:
+            if len(self.status_cache) >= STATUS_CACHE_SIZE:
+                self.status_cache.clear()
+            status = self.status_cache[self.zobrist_key] = get_game_status(self, self.turn)
+        return status
+
+    def legal_targets(self, start_pos):
+        # Promotions list the same target once per piece
+        targets = []
+        for start, end, *_ in self.status().legal_moves:
+            if start == start_pos and end not in targets:
+                targets.append(end)
+        return targets
+
+    def is_square_attacked(self, square, by_color):
+        return is_square_attacked(self, square, by_color)
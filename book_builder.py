@@ -0,0 +1,68 @@
+import sys
+
+from board import Board
+from opening_book import write_book
+from pgn import move_lists
+
+BOOK_PLIES = 16  # Moves past this ply of a game are left to the search
+
+
+def parse_coordinate_move(text):
+    # 'e2e4', or 'e7e8n' for an underpromotion
+    start = (8 - int(text[1]), ord(text[0]) - ord('a'))
+    end = (8 - int(text[3]), ord(text[2]) - ord('a'))
+    if len(text) > 4 and text[4] in 'nbr':
+        return (start, end, 'nbr'.index(text[4]) + 2)
+    return (start, end)
+
+
+def read_move_lists(path):
+    # One game per line as coordinate moves; blank lines and '#' comments are skipped
+    with open(path) as corpus:
+        for line in corpus:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield [parse_coordinate_move(text) for text in line.split()]
+
+
+def add_game(counts, moves, max_plies=BOOK_PLIES):
+    # Counts every (position, move) pair of the game's opening; a game with an illegal
+    # move is left out entirely
+    board_obj = Board()
+    pairs = []
+    for move in moves[:max_plies]:
+        if move not in board_obj.get_all_legal_moves(board_obj.turn):
+            return False
+        pairs.append((board_obj.zobrist_key, move))
+        board_obj.make_move(move)
+    for key, move in pairs:
+        position = counts.setdefault(key, {})
+        position[move] = position.get(move, 0) + 1
+    return True
+
+
+def build_book(corpus_paths, book_path, max_plies=BOOK_PLIES, games=None):
+    # Compiles move-list and .pgn files, plus any already parsed games, into a book file.
+    # Returns the number of games used and the number rejected
+    counts = {}
+    used = rejected = 0
+    sources = [move_lists(path, max_plies) if path.endswith('.pgn') else read_move_lists(path)
+               for path in corpus_paths]
+    if games is not None:
+        sources.append(games)
+    for source in sources:
+        for moves in source:
+            if add_game(counts, moves, max_plies):
+                used += 1
+            else:
+                rejected += 1
+    write_book(book_path, counts)
+    return used, rejected
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: python book_builder.py CORPUS... BOOK')
+        raise SystemExit(2)
+    used, rejected = build_book(sys.argv[1:-1], sys.argv[-1])
+    print(f'{used} games used, {rejected} rejected')
@@ -1,102 +1,115 @@
-import board
-import copy
+from attack_tables import KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, PAWN_ATTACKER_SQUARES
+from pieces import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK, TYPE_MASK, COLOR_BITS
 
 
 def find_king(board, king_color):
 
-    king_symbol = 'wK' if king_color == 'white' else 'bK'
-    for row in range(8):
-        for col in range(8):
-            if board[row][col] == king_symbol:
-                return (row, col)
-    return None
+    king_square = board.find(COLOR_BITS[king_color] | KING)
+    if king_square < 0:
+        return None
+    return divmod(king_square, 8)
 
 
-def is_in_check(board_obj, color):
+def is_square_attacked(board_obj, square, by_color):
+    # Looks outward from the square and stops each ray at its first piece
+    board = board_obj.squares
+    by_bit = COLOR_BITS[by_color]
 
-    board = board_obj.board if hasattr(board_obj, 'board') else board_obj
-    king_pos = find_king(board, color)
+    knight = by_bit | KNIGHT
+    for source in KNIGHT_TARGETS[square]:
+        if board[source] == knight:
+            return True
 
-    if not king_pos:
-        return False
+    pawn = by_bit | PAWN
+    for source in PAWN_ATTACKER_SQUARES[by_bit][square]:
+        if board[source] == pawn:
+            return True
 
-    opposite_color = 'black' if color == 'white' else 'white'
+    king = by_bit | KING
+    for source in KING_TARGETS[square]:
+        if board[source] == king:
+            return True
 
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece.strip() != '' and piece[0].lower() == opposite_color[0].lower():
-                if is_piece_threatening_king(piece, (row, col), king_pos, board):
+    queen = by_bit | QUEEN
+    rook = by_bit | ROOK
+    for ray in ROOK_RAYS[square]:
+        for source in ray:
+            piece = board[source]
+            if piece != EMPTY:
+                if piece == rook or piece == queen:
                     return True
-    return False
-
-
-def is_piece_threatening_king(piece, piece_pos, king_pos, board):
-
-    pr, pc = piece_pos
-    kr, kc = king_pos
-
-
-    if piece[1].lower() == 'p':
-        if piece[0] == 'b':
-            return kr == pr + 1 and (kc == pc - 1 or kc == pc + 1)
-        elif piece[0] == 'w':
-            return kr == pr - 1 and (kc == pc - 1 or kc == pc + 1)
+                break
+
+    bishop = by_bit | BISHOP
+    for ray in BISHOP_RAYS[square]:
+        for source in ray:
+            piece = board[source]
+            if piece != EMPTY:
+                if piece == bishop or piece == queen:
+                    return True
+                break
 
+    return False
 
-    if piece[1].lower() == 'n':
-        return (abs(kr - pr), abs(kc - pc)) in [(2, 1), (1, 2)]
 
+def least_valuable_attacker(board_obj, square, by_color, removed=frozenset()):
+    # Square of the cheapest piece of by_color attacking the square, or None. Pieces on
+    # removed squares are looked through, so sliders behind them join the exchange
+    board = board_obj.squares
+    by_bit = COLOR_BITS[by_color]
+
+    pawn = by_bit | PAWN
+    for source in PAWN_ATTACKER_SQUARES[by_bit][square]:
+        if board[source] == pawn and source not in removed:
+            return source
+
+    knight = by_bit | KNIGHT
+    for source in KNIGHT_TARGETS[square]:
+        if board[source] == knight and source not in removed:
+            return source
+
+    best = None
+    best_type = KING
+    for rays, sliders in ((BISHOP_RAYS[square], (BISHOP, QUEEN)), (ROOK_RAYS[square], (ROOK, QUEEN))):
+        for ray in rays:
+            for source in ray:
+                piece = board[source]
+                if piece == EMPTY or source in removed:
+                    continue
+                piece_type = piece & TYPE_MASK
+                if (piece & BLACK) == by_bit and piece_type in sliders and piece_type < best_type:
+                    best, best_type = source, piece_type
+                break
+    if best is not None:
+        return best
+
+    king = by_bit | KING
+    for source in KING_TARGETS[square]:
+        if board[source] == king and source not in removed:
+            return source
+    return None
 
-    if piece[1].lower() in ['r', 'q']:
-        if pr == kr:
-            step = 1 if kc > pc else -1
-            for c in range(pc + step, kc, step):
-                if not is_empty(board[pr][c]):
-                    return False
-            return True
-        if pc == kc:
-            step = 1 if kr > pr else -1
-            for r in range(pr + step, kr, step):
-                if not is_empty(board[r][pc]):
-                    return False
-            return True
 
-    if piece[1].lower() in ['b', 'q']:
-        if abs(pr - kr) == abs(pc - kc):
-            step_r = 1 if kr > pr else -1
-            step_c = 1 if kc > pc else -1
-            r, c = pr + step_r, pc + step_c
-            while r != kr and c != kc:
-                if not is_empty(board[r][c]):
-                    return False
-                r += step_r
-                c += step_c
-            return True
+def is_in_check(board_obj, color):
 
-    # تهديدات الملك
-    if piece[1].lower() == 'k':
-        return max(abs(kr - pr), abs(kc - pc)) == 1
+    king_square = board_obj.king_squares[COLOR_BITS[color] >> 3]
+    if king_square < 0:
+        return False
 
-    return False
+    return is_square_attacked(board_obj, king_square, 'black' if color == 'white' else 'white')
 
 
 def is_checkmate(board_obj, color):
-    if not is_in_check(board_obj, color):
+    if not board_obj.is_in_check(color):
         return False
 
-    for move in board_obj.get_all_legal_moves(color):
-        temp_board = copy.deepcopy(board_obj)
-        temp_board.move_piece(move, color)
-        if not is_in_check(temp_board, color):
-            return False
-
-    return True
+    # Every generated move already leaves the king safe
+    return len(board_obj.get_all_legal_moves(color)) == 0
 
 
 def is_stalemate(board_obj, color):
 
-    if is_in_check(board_obj, color):
+    if board_obj.is_in_check(color):
         return False
 
 
@@ -106,5 +119,20 @@ def is_stalemate(board_obj, color):
     return False
 
 
+class GameStatus:
+    # Everything the UI asks about one position, for the side to move
+    __slots__ = ('in_check', 'checkmate', 'stalemate', 'legal_moves')
+
+    def __init__(self, in_check, legal_moves):
+        self.in_check = in_check
+        self.legal_moves = legal_moves
+        self.checkmate = in_check and not legal_moves
+        self.stalemate = not in_check and not legal_moves
+
+
+def get_game_status(board_obj, color):
+    return GameStatus(board_obj.is_in_check(color), tuple(board_obj.get_all_legal_moves(color)))
+
+
 def is_empty(square):
-    return square in ['  ', '##']
\ No newline at end of file
+    return square == EMPTY
@@ -0,0 +1,188 @@
+import sys
+import threading
+
+import ai
+from board import Board
+from book_builder import parse_coordinate_move
+from pieces import PAWN, QUEEN, TYPE_MASK
+
+ENGINE_NAME = 'ChessGame'
+INFINITE_DEPTH = 64  # Depth for go infinite; the search runs until stop
+MOVES_TO_GO = 30  # Moves the remaining clock is spread over when the GUI does not say
+MAX_HASH_MB = 1024
+
+
+def uci_move(board_obj, move):
+    # Coordinate notation, with the promotion piece spelt out as UCI requires
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    text = chr(from_col + ord('a')) + str(8 - from_row) + chr(to_col + ord('a')) + str(8 - to_row)
+    if board_obj.squares[from_row * 8 + from_col] & TYPE_MASK == PAWN and to_row in (0, 7):
+        text += 'nbrq'[(move[2] if len(move) > 2 else QUEEN) - 2]
+    return text
+
+
+def uci_line(board_obj, moves):
+    texts = []
+    undos = []
+    for move in moves:
+        texts.append(uci_move(board_obj, move))
+        undos.append(board_obj.make_move(move))
+    for undo in reversed(undos):
+        board_obj.unmake_move(undo)
+    return ' '.join(texts)
+
+
+def uci_score(score, pv):
+    # Our scores are tenths of a pawn, from the side to move's point of view
+    if abs(score) >= -ai.CHECKMATE:
+        plies = max(len(pv), 1)
+    elif abs(score) > ai.TABLEBASE_WIN - 256:
+        plies = ai.TABLEBASE_WIN - abs(score)
+    else:
+        return f'cp {score * 10}'
+    return f'mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}'
+
+
+def parse_go(tokens, color):
+    # (time_limit, max_depth, max_nodes, infinite) for the arguments of a go command
+    values = {}
+    infinite = False
+    index = 0
+    while index < len(tokens):
+        if tokens[index] == 'infinite':
+            infinite = True
+        elif index + 1 < len(tokens) and tokens[index + 1].lstrip('-').isdigit():
+            values[tokens[index]] = int(tokens[index + 1])
+            index += 1
+        index += 1
+    if infinite:
+        return None, INFINITE_DEPTH, None, True
+    max_depth = values.get('depth', INFINITE_DEPTH if 'movetime' in values or 'wtime' in values
+                           or 'nodes' in values else ai.MAX_DEPTH)
+    time_limit = None
+    if 'movetime' in values:
+        time_limit = values['movetime'] / 1000
+    elif ('wtime' if color == 'white' else 'btime') in values:
+        remaining = values['wtime' if color == 'white' else 'btime'] / 1000
+        increment = values.get('winc' if color == 'white' else 'binc', 0) / 1000
+        time_limit = min(remaining / values.get('movestogo', MOVES_TO_GO) + increment * 0.8, remaining / 2)
+    elif 'depth' not in values and 'nodes' not in values:
+        time_limit = ai.AI_TIME_LIMIT
+    return time_limit, max_depth, values.get('nodes'), False
+
+
+class UciEngine:
+    # Reads commands from input and answers on output; searches run on a worker thread
+    # so stop and isready are handled while it thinks
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.lock = threading.Lock()
+        self.board = Board()
+        self.thread = None
+        self.stop_event = None
+
+    def send(self, line):
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def report(self, board_obj, stats):
+        info = (f'info depth {stats.depth} score {uci_score(stats.score, stats.pv)} nodes {stats.nodes} '
+                f'nps {stats.nps:.0f} time {stats.seconds * 1000:.0f}')
+        if stats.pv:
+            info += ' pv ' + uci_line(board_obj, stats.pv)
+        self.send(info)
+
+    def search(self, board_obj, time_limit, max_depth, max_nodes, infinite):
+        move, stats = ai.get_ai_move(board_obj, board_obj.turn, time_limit, max_nodes, max_depth,
+                                     self.stop_event, return_stats=True,
+                                     progress_hook=lambda progress: self.report(board_obj, progress))
+        if stats is not None and not stats.iteration_nodes and stats.score is not None:
+            self.report(board_obj, stats)  # Book and tablebase moves have no iterations
+        if infinite:
+            # The best move is only given once the GUI says stop
+            self.stop_event.wait()
+        self.send('bestmove ' + (uci_move(board_obj, move) if move is not None else '0000'))
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def set_position(self, tokens):
+        if tokens and tokens[0] == 'fen':
+            fen_end = tokens.index('moves') if 'moves' in tokens else len(tokens)
+            board_obj = Board.from_fen(' '.join(tokens[1:fen_end]))
+            tokens = tokens[fen_end:]
+        else:
+            board_obj = Board()
+            tokens = tokens[1:]
+        if tokens and tokens[0] == 'moves':
+            for text in tokens[1:]:
+                if not board_obj.move_piece(parse_coordinate_move(text), board_obj.turn):
+                    self.send(f'info string illegal move {text}')
+                    break
+        self.board = board_obj
+
+    def set_option(self, tokens):
+        if 'value' not in tokens:
+            return
+        name = ' '.join(tokens[1:tokens.index('value')]).lower()
+        value = ' '.join(tokens[tokens.index('value') + 1:])
+        if name == 'hash':
+            ai.set_hash_size(max(1, min(int(value), MAX_HASH_MB)))
+        elif name == 'ownbook':
+            ai.USE_BOOK = value.lower() == 'true'
+
+    def handle(self, line):
+        # Returns False once the GUI quits
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send('id author ChessGame contributors')
+            self.send(f'option name Hash type spin default {ai.HASH_SIZE_MB} min 1 max {MAX_HASH_MB}')
+            self.send(f'option name OwnBook type check default {"true" if ai.USE_BOOK else "false"}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.stop()
+            self.set_option(tokens[1:])
+        elif command == 'ucinewgame':
+            self.stop()
+            ai.transposition_table.clear()
+            self.board = Board()
+        elif command == 'position':
+            self.stop()
+            self.set_position(tokens[1:])
+        elif command == 'go':
+            self.stop()
+            self.stop_event = threading.Event()
+            board_obj = Board.decode(self.board.encode())
+            self.thread = threading.Thread(target=self.search,
+                                           args=(board_obj, *parse_go(tokens[1:], board_obj.turn)),
+                                           daemon=True)
+            self.thread.start()
+        elif command == 'stop':
+            self.stop()
+        elif command == 'quit':
+            self.stop()
+            return False
+        return True
+
+
+def main():
+    ai.VERBOSE = False  # Standard output carries only protocol lines
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 import pygame 
 from board import Board 
-from ai import get_ai_move 
-from checkmate_logic import is_checkmate, is_stalemate 
+from ai_worker import SearchWorker 
  
 # Constants 
 WIDTH, HEIGHT = 600, 490 
 SIDE_PANEL_WIDTH = 160 
 SQ_SIZE = (WIDTH - SIDE_PANEL_WIDTH) // 8 
 MAX_FPS = 15 
+PONDER = True  # Search the expected reply while the player thinks
 PANEL_HEIGHT = 48 
 MAX_VISIBLE_MOVES = (HEIGHT - PANEL_HEIGHT) // 20 
  
@@ -46,6 +46,11 @@ def draw_pieces(screen, board):
             if piece in IMAGES: 
                 screen.blit(IMAGES[piece], pygame.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)) 
  
+def draw_legal_targets(screen, targets):
+    for row, col in targets:
+        center = (col * SQ_SIZE + SQ_SIZE // 2, row * SQ_SIZE + SQ_SIZE // 2)
+        pygame.draw.circle(screen, pygame.Color("gold"), center, SQ_SIZE // 6)
+
 def draw_status_bar(screen, text): 
     pygame.draw.rect(screen, pygame.Color("dodgerblue4"), pygame.Rect(0, HEIGHT - PANEL_HEIGHT, WIDTH, PANEL_HEIGHT)) 
     label = font.render(text, True, pygame.Color("white")) 
@@ -90,9 +95,8 @@ def display_winner(screen, winner):
     pygame.display.flip() 
     return play_again_btn 
 
-def display_stalemate(screen): 
+def display_stalemate(screen, message="Stalemate! It's a Draw!"): 
     font = pygame.font.SysFont("Arial", 48) 
-    message = "Stalemate! It's a Draw!" 
     text_surface = font.render(message, True, (255, 255, 0)) 
     screen.blit(text_surface, (WIDTH // 6, HEIGHT // 3 - 40)) 
  
@@ -131,6 +135,7 @@ def draw_move_history(screen, moves):
 def main(): 
     draw_loading_screen() 
     load_images() 
+    ai_worker = SearchWorker()
     game_running = True 
  
     while game_running: 
@@ -161,7 +166,7 @@ def main():
                     if e.type == pygame.QUIT: 
                         running = False 
                         game_running = False 
-                    elif e.type == pygame.MOUSEBUTTONDOWN: 
+                    elif e.type == pygame.MOUSEBUTTONDOWN and not (game_mode == "pve" and current_turn == "black"):
                         x, y = pygame.mouse.get_pos() 
                         if y < HEIGHT - PANEL_HEIGHT: 
                             col = x // SQ_SIZE 
@@ -185,6 +190,8 @@ def main():
                                             move_history.pop(0) 
                                         current_turn = "black" if current_turn == "white" else "white" 
                                         last_move_str = move_str 
+                                        if game_mode == "pve":
+                                            ai_worker.opponent_moved(board_obj, (start, end), "black")
                                 selected_sq = None 
                                 player_clicks = [] 
  
@@ -197,13 +204,16 @@ def main():
                     s.set_alpha(100) 
                     s.fill(pygame.Color('blue')) 
                     screen.blit(s, (selected_sq[1] * SQ_SIZE, selected_sq[0] * SQ_SIZE)) 
-                draw_status_bar(screen, last_move_str) 
+                    draw_legal_targets(screen, board_obj.legal_targets(selected_sq))
+                draw_status_bar(screen, "AI thinking..." if ai_worker.busy else last_move_str)
                 clock.tick(MAX_FPS) 
                 pygame.display.flip() 
  
+                # The search runs in the background; its move is applied once it finishes
                 if game_mode == "pve" and current_turn == "black": 
-                    pygame.time.delay(500) 
-                    ai_move = get_ai_move(board_obj, "black") 
+                    if not ai_worker.busy:
+                        ai_worker.start(board_obj, "black")
+                    ai_move = ai_worker.poll()
                     if ai_move: 
                         success = board_obj.move_piece(ai_move, "black") 
                         if success: 
@@ -213,8 +223,12 @@ def main():
                                 move_history.pop(0) 
                             current_turn = "white" 
                             last_move_str = ai_move_str 
+                            if PONDER:
+                                ai_worker.ponder(board_obj, "black")
  
-                if is_checkmate(board_obj, current_turn): 
+                # Computed once per position; later frames read the cached result
+                status = board_obj.status()
+                if status.checkmate: 
                     winner = "White" if current_turn == "black" else "Black" 
                     btn = display_winner(screen, winner) 
                     waiting = True 
@@ -229,8 +243,9 @@ def main():
                                 if btn.collidepoint(x, y): 
                                     waiting = False 
                                     running = False 
-                elif is_stalemate(board_obj, current_turn):
-                    btn = display_stalemate(screen)
+                elif status.stalemate or board_obj.is_threefold_repetition():
+                    btn = display_stalemate(screen, "Stalemate! It's a Draw!" if status.stalemate
+                                            else "Repetition! It's a Draw!")
                     waiting = True
                     while waiting:
                         for e in pygame.event.get():
@@ -243,6 +258,9 @@ def main():
                                 if btn.collidepoint(x, y):
                                     waiting = False
                                     running = False 
+
+        # Stop any search or ponder before a new game or quitting
+        ai_worker.cancel()
  
     pygame.quit() 
  
@@ -0,0 +1,219 @@
+from checkmate_logic import is_in_check, is_square_attacked
+from attack_tables import (KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, SLIDER_RAYS,
+                           PAWN_ATTACKER_SQUARES)
+from pieces import (EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK, TYPE_MASK, COLOR_BITS,
+                    WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, SQUARE_POS,
+                    UNDERPROMOTIONS)
+
+# (rights flag, squares that must be empty, square the king crosses, king target)
+CASTLING_PATHS = {
+    'white': ((WHITE_KINGSIDE, (61, 62), 61, 62), (WHITE_QUEENSIDE, (59, 58, 57), 59, 58)),
+    'black': ((BLACK_KINGSIDE, (5, 6), 5, 6), (BLACK_QUEENSIDE, (3, 2, 1), 3, 2)),
+}
+KING_HOME = {'white': 60, 'black': 4}
+
+
+def get_pawn_targets(board_obj, squares, start, color):
+    color_bit = COLOR_BITS[color]
+    row, col = SQUARE_POS[start]
+    direction = -8 if color == 'white' else 8
+    start_row = 6 if color == 'white' else 1
+    targets = []
+
+    one_step = start + direction
+    if 0 <= one_step < 64:
+        if squares[one_step] == EMPTY:
+            targets.append(one_step)
+            two_step = one_step + direction
+            if row == start_row and squares[two_step] == EMPTY:
+                targets.append(two_step)
+        for end, end_col in ((one_step - 1, col - 1), (one_step + 1, col + 1)):
+            if 0 <= end_col < 8:
+                target = squares[end]
+                if (target != EMPTY and (target & BLACK) != color_bit) or end == board_obj.en_passant_target:
+                    targets.append(end)
+    return targets
+
+
+def get_offset_targets(squares, start, color, table):
+    color_bit = COLOR_BITS[color]
+    return [end for end in table[start]
+            if squares[end] == EMPTY or (squares[end] & BLACK) != color_bit]
+
+
+def get_sliding_targets(squares, start, color, table):
+    color_bit = COLOR_BITS[color]
+    targets = []
+    for ray in table[start]:
+        for end in ray:
+            target = squares[end]
+            if target == EMPTY:
+                targets.append(end)
+            else:
+                if (target & BLACK) != color_bit:
+                    targets.append(end)
+                break
+    return targets
+
+
+def get_castling_targets(board_obj, squares, start, color):
+    if start != KING_HOME[color] or not board_obj.castling_rights:
+        return []
+    if is_in_check(board_obj, color):
+        return []
+
+    opponent = 'black' if color == 'white' else 'white'
+    targets = []
+    for flag, between, crossed, end in CASTLING_PATHS[color]:
+        if not board_obj.castling_rights & flag:
+            continue
+        if any(squares[square] != EMPTY for square in between):
+            continue
+        # The king may not pass through an attacked square
+        if not is_square_attacked(board_obj, crossed, opponent):
+            targets.append(end)
+    return targets
+
+
+def get_pseudo_legal_targets(board_obj, start, color):
+    squares = board_obj.squares
+    piece_type = squares[start] & TYPE_MASK
+
+    if piece_type == PAWN:
+        return get_pawn_targets(board_obj, squares, start, color)
+    if piece_type == KNIGHT:
+        return get_offset_targets(squares, start, color, KNIGHT_TARGETS)
+    if piece_type == KING:
+        return (get_offset_targets(squares, start, color, KING_TARGETS) +
+                get_castling_targets(board_obj, squares, start, color))
+    if piece_type in SLIDER_RAYS:
+        return get_sliding_targets(squares, start, color, SLIDER_RAYS[piece_type])
+    return []
+
+
+def leaves_king_safe(board_obj, move, color):
+    undo = board_obj.make_move(move)
+    safe = not is_in_check(board_obj, color)
+    board_obj.unmake_move(undo)
+    return safe
+
+
+def get_checks_and_pins(board_obj, color):
+    # Returns the squares each checker leaves open to block or capture it, and the
+    # squares every pinned piece may still move to along its pin ray
+    squares = board_obj.squares
+    color_bit = COLOR_BITS[color]
+    enemy_bit = color_bit ^ BLACK
+    king = board_obj.king_squares[color_bit >> 3]
+    checks = []
+    pins = {}
+
+    knight = enemy_bit | KNIGHT
+    for source in KNIGHT_TARGETS[king]:
+        if squares[source] == knight:
+            checks.append((source,))
+    pawn = enemy_bit | PAWN
+    for source in PAWN_ATTACKER_SQUARES[enemy_bit][king]:
+        if squares[source] == pawn:
+            checks.append((source,))
+
+    queen = enemy_bit | QUEEN
+    for rays, slider in ((ROOK_RAYS[king], enemy_bit | ROOK), (BISHOP_RAYS[king], enemy_bit | BISHOP)):
+        for ray in rays:
+            own_piece = None
+            for index, square in enumerate(ray):
+                piece = squares[square]
+                if piece == EMPTY:
+                    continue
+                if (piece & BLACK) == color_bit:
+                    if own_piece is None:
+                        own_piece = square
+                        continue
+                elif piece == slider or piece == queen:
+                    if own_piece is None:
+                        checks.append(ray[:index + 1])
+                    else:
+                        pins[own_piece] = frozenset(ray[:index + 1])
+                break
+    return checks, pins
+
+
+def get_king_step_targets(board_obj, squares, king, color):
+    # The king is lifted off the board so it cannot shield squares behind itself
+    opponent = 'black' if color == 'white' else 'white'
+    king_piece = squares[king]
+    squares[king] = EMPTY
+    targets = [end for end in get_offset_targets(squares, king, color, KING_TARGETS)
+               if not is_square_attacked(board_obj, end, opponent)]
+    squares[king] = king_piece
+    return targets
+
+
+def add_moves(moves, start_pos, piece, targets):
+    # A pawn reaching the last rank adds one move per promotion piece, the queen first
+    promotes = piece & TYPE_MASK == PAWN
+    for end in targets:
+        end_pos = SQUARE_POS[end]
+        moves.append((start_pos, end_pos))
+        if promotes and (end < 8 or end >= 56):
+            for piece_type in UNDERPROMOTIONS:
+                moves.append((start_pos, end_pos, piece_type))
+
+
+def generate_piece_moves(board_obj, start_pos, color, checks_and_pins=None):
+    start = start_pos[0] * 8 + start_pos[1]
+    squares = board_obj.squares
+    piece = squares[start]
+    if piece == EMPTY or (piece & BLACK) != COLOR_BITS[color]:
+        return []
+
+    king = board_obj.king_squares[COLOR_BITS[color] >> 3]
+    if king < 0:
+        # Without a king every pseudo-legal move is legal
+        moves = []
+        add_moves(moves, start_pos, piece, sorted(get_pseudo_legal_targets(board_obj, start, color)))
+        return moves
+
+    checks, pins = checks_and_pins or get_checks_and_pins(board_obj, color)
+    if start == king:
+        targets = get_king_step_targets(board_obj, squares, king, color)
+        if not checks:
+            opponent = 'black' if color == 'white' else 'white'
+            targets += [end for end in get_castling_targets(board_obj, squares, start, color)
+                        if not is_square_attacked(board_obj, end, opponent)]
+        return [(start_pos, SQUARE_POS[end]) for end in sorted(targets)]
+    if len(checks) > 1:
+        return []  # Only the king can answer a double check
+
+    check_mask = checks[0] if checks else None
+    pin_mask = pins.get(start)
+    is_pawn = piece & TYPE_MASK == PAWN
+    targets = []
+    for end in sorted(get_pseudo_legal_targets(board_obj, start, color)):
+        if is_pawn and end == board_obj.en_passant_target and (end - start) % 8:
+            # En passant lifts two pawns off one rank, which masks cannot see
+            if leaves_king_safe(board_obj, (start_pos, SQUARE_POS[end]), color):
+                targets.append(end)
+            continue
+        if check_mask is not None and end not in check_mask:
+            continue
+        if pin_mask is not None and end not in pin_mask:
+            continue
+        targets.append(end)
+    moves = []
+    add_moves(moves, start_pos, piece, targets)
+    return moves
+
+
+def generate_legal_moves(board_obj, color):
+    color_bit = COLOR_BITS[color]
+    squares = board_obj.squares
+    checks_and_pins = None
+    if board_obj.king_squares[color_bit >> 3] >= 0:
+        checks_and_pins = get_checks_and_pins(board_obj, color)
+    moves = []
+    for start in range(64):
+        piece = squares[start]
+        if piece != EMPTY and (piece & BLACK) == color_bit:
+            moves.extend(generate_piece_moves(board_obj, SQUARE_POS[start], color, checks_and_pins))
+    return moves
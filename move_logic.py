@@ -1,61 +1,226 @@
 from move_validation import get_piece_moves
-import copy
-
-def handle_move(board_obj, move, color): 
-    start_pos, end_pos = move 
-    start_row, start_col = start_pos 
-    end_row, end_col = end_pos 
- 
-    piece = board_obj.board[start_row][start_col] 
- 
-    # Check if the move is valid 
-    if not get_piece_moves(piece, board_obj, start_pos, color, end_pos): 
-        return False 
- 
-    # Castling logic 
-    #black
-    if start_row==0: 
-        if piece[1] == 'K' and abs(start_col - end_col) == 2: 
-            row = start_row 
-            if end_col == 6:  # Kingside
-                board_obj.board[row][5] = color[0] + 'R' 
-                board_obj.board[row][7] = '  ' if (row + 7) % 2 == 0 else '##' 
-            elif end_col == 2:  # Queenside
-                board_obj.board[row][3] = color[0] + 'R' 
-                board_obj.board[row][0] = '  ' if (row + 0) % 2 == 0 else '##' 
-            board_obj.castling_rights[color]['K'] = False 
-            board_obj.castling_rights[color]['Q'] = False 
-    elif start_row==7: #white
-        if piece[1] == 'K' and abs(start_col - end_col) == 2: 
-            row = start_row 
-            if end_col == 6:  # Kingside
-                board_obj.board[row][5] = color[0] + 'R' 
-                board_obj.board[row][7] = '  ' if (row + 7) % 2 == 0 else '##' 
-            elif end_col == 2:  # Queenside
-                board_obj.board[row][3] = color[0] + 'R' 
-                board_obj.board[row][0] = '  ' if (row + 0) % 2 == 0 else '##' 
-            board_obj.castling_rights[color]['K'] = False 
-            board_obj.castling_rights[color]['Q'] = False 
-    # Save board state
-    board_obj.history.append(copy.deepcopy(board_obj.board)) 
+from ai import MATERIAL_VALUES, POSITION_VALUES
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+from pieces import (EMPTY, PAWN, KING, QUEEN, BLACK, TYPE_MASK, WHITE_KINGSIDE, WHITE_QUEENSIDE,
+                    BLACK_KINGSIDE, BLACK_QUEENSIDE, ALL_CASTLING, SQUARE_POS, UNDERPROMOTIONS, square_index)
+
+# Castling rights kept when a piece leaves or lands on each square
+CASTLING_MASKS = [ALL_CASTLING] * 64
+CASTLING_MASKS[0] &= ~BLACK_QUEENSIDE
+CASTLING_MASKS[4] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[7] &= ~BLACK_KINGSIDE
+CASTLING_MASKS[56] &= ~WHITE_QUEENSIDE
+CASTLING_MASKS[60] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[63] &= ~WHITE_KINGSIDE
+
+
+class MoveUndo:
+    __slots__ = ('start', 'end', 'piece', 'captured', 'captured_square', 'en_passant_target',
+                 'castling_rights', 'promoted', 'zobrist_key', 'material', 'position_score', 'halfmove_clock')
+
+    def __init__(self, start, end, piece, captured, captured_square, en_passant_target,
+                 castling_rights, promoted, zobrist_key, material, position_score, halfmove_clock):
+        self.start = start
+        self.end = end
+        self.piece = piece
+        self.captured = captured
+        self.captured_square = captured_square
+        self.en_passant_target = en_passant_target
+        self.castling_rights = castling_rights
+        self.promoted = promoted
+        self.zobrist_key = zobrist_key
+        self.material = material
+        self.position_score = position_score
+        self.halfmove_clock = halfmove_clock
+
+
+def make_move(board_obj, move):
+    # Plays a move known to be legal and returns what is needed to take it back
+    start = square_index(move[0])
+    end = square_index(move[1])
+    squares = board_obj.squares
+    piece = squares[start]
+    piece_type = piece & TYPE_MASK
+    captured = squares[end]
+    old_en_passant = board_obj.en_passant_target
+    old_castling = board_obj.castling_rights
+
+    material = board_obj.material
+    position = board_obj.position_score
+    undo = MoveUndo(start, end, piece, captured, end, old_en_passant, old_castling, EMPTY,
+                    board_obj.zobrist_key, material, position, board_obj.halfmove_clock)
+    piece_keys = PIECE_KEYS[piece]
+    key = board_obj.zobrist_key ^ SIDE_KEY ^ piece_keys[start]
+    position -= POSITION_VALUES[piece][start]
+    if captured != EMPTY:
+        key ^= PIECE_KEYS[captured][end]
+        material -= MATERIAL_VALUES[captured]
+        position -= POSITION_VALUES[captured][end]
 
     # === En Passant Capture ===
-    if piece[1] == 'P' and (end_row, end_col) == board_obj.en_passant_target:
-        board_obj.board[start_row][end_col] = '  ' if (start_row + end_col) % 2 == 0 else '##'  # Remove captured pawn
+    if piece_type == PAWN and end == old_en_passant and (start - end) % 8:
+        captured_square = (start & ~7) | (end & 7)
+        undo.captured = squares[captured_square]
+        undo.captured_square = captured_square
+        squares[captured_square] = EMPTY
+        key ^= PIECE_KEYS[undo.captured][captured_square]
+        material -= MATERIAL_VALUES[undo.captured]
+        position -= POSITION_VALUES[undo.captured][captured_square]
 
     # Move the piece
-    board_obj.board[end_row][end_col] = piece 
-    board_obj.board[start_row][start_col] = '  ' if (start_row + start_col) % 2 == 0 else '##' 
+    squares[end] = piece
+    squares[start] = EMPTY
+
+    # === Castling ===
+    if piece_type == KING:
+        board_obj.king_squares[piece >> 3] = end
+        if end - start == 2:
+            rook_from, rook_to = start + 3, start + 1
+        elif start - end == 2:
+            rook_from, rook_to = start - 4, start - 1
+        else:
+            rook_from = None
+        if rook_from is not None:
+            rook = squares[rook_from]
+            squares[rook_to] = rook
+            squares[rook_from] = EMPTY
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+            position += POSITION_VALUES[rook][rook_to] - POSITION_VALUES[rook][rook_from]
+    castling = old_castling & CASTLING_MASKS[start] & CASTLING_MASKS[end]
+    if castling != old_castling:
+        board_obj.castling_rights = castling
+        key ^= CASTLING_KEYS[old_castling] ^ CASTLING_KEYS[castling]
 
     # === Promotion ===
-    if piece[1] == 'P':
-        if (color == "white" and end_row == 0) or (color == "black" and end_row == 7):
-            board_obj.board[end_row][end_col] = color[0] + 'Q'
+    if piece_type == PAWN and (end < 8 or end >= 56):
+        promoted = (piece & ~TYPE_MASK) | (move[2] if len(move) > 2 else QUEEN)
+        squares[end] = promoted
+        undo.promoted = promoted
+        key ^= PIECE_KEYS[promoted][end]
+        material += MATERIAL_VALUES[promoted] - MATERIAL_VALUES[piece]
+        position += POSITION_VALUES[promoted][end]
+    else:
+        key ^= piece_keys[end]
+        position += POSITION_VALUES[piece][end]
 
     # === Set En Passant Target ===
-    if piece[1] == 'P' and abs(end_row - start_row) == 2:
-        board_obj.en_passant_target = ((start_row + end_row) // 2, start_col)
+    if old_en_passant is not None:
+        key ^= EN_PASSANT_KEYS[old_en_passant & 7]
+    if piece_type == PAWN and abs(end - start) == 16:
+        board_obj.en_passant_target = (start + end) // 2
+        key ^= EN_PASSANT_KEYS[start & 7]
     else:
         board_obj.en_passant_target = None
 
+    board_obj.zobrist_key = key
+    board_obj.material = material
+    board_obj.position_score = position
+    board_obj.halfmove_clock = 0 if piece_type == PAWN or captured != EMPTY else undo.halfmove_clock + 1
+    if piece & BLACK:
+        board_obj.fullmove_number += 1
+        board_obj.turn = 'white'
+    else:
+        board_obj.turn = 'black'
+    return undo
+
+
+def make_null_move(board_obj):
+    # Passes the turn without moving; only the side, en passant square and key change
+    undo = (board_obj.en_passant_target, board_obj.zobrist_key)
+    key = board_obj.zobrist_key ^ SIDE_KEY
+    if board_obj.en_passant_target is not None:
+        key ^= EN_PASSANT_KEYS[board_obj.en_passant_target & 7]
+        board_obj.en_passant_target = None
+    board_obj.zobrist_key = key
+    board_obj.turn = 'black' if board_obj.turn == 'white' else 'white'
+    return undo
+
+
+def unmake_null_move(board_obj, undo):
+    board_obj.en_passant_target, board_obj.zobrist_key = undo
+    board_obj.turn = 'black' if board_obj.turn == 'white' else 'white'
+
+
+def unmake_move(board_obj, undo):
+    start, end = undo.start, undo.end
+    squares = board_obj.squares
+
+    squares[start] = undo.piece
+    squares[end] = EMPTY
+    squares[undo.captured_square] = undo.captured
+
+    if undo.piece & TYPE_MASK == KING:
+        board_obj.king_squares[undo.piece >> 3] = start
+        if end - start == 2:
+            squares[start + 3] = squares[start + 1]
+            squares[start + 1] = EMPTY
+        elif start - end == 2:
+            squares[start - 4] = squares[start - 1]
+            squares[start - 1] = EMPTY
+
+    board_obj.castling_rights = undo.castling_rights
+    board_obj.en_passant_target = undo.en_passant_target
+    board_obj.zobrist_key = undo.zobrist_key
+    board_obj.material = undo.material
+    board_obj.position_score = undo.position_score
+    board_obj.halfmove_clock = undo.halfmove_clock
+    if undo.piece & BLACK:
+        board_obj.fullmove_number -= 1
+        board_obj.turn = 'black'
+    else:
+        board_obj.turn = 'white'
+
+
+def handle_move(board_obj, move, color):
+    start_pos, end_pos = move[0], move[1]
+
+    piece = board_obj.squares[square_index(start_pos)]
+
+    # A third element only names the underpromotion of a pawn reaching the last rank
+    if len(move) > 2 and (move[2] not in UNDERPROMOTIONS or piece & TYPE_MASK != PAWN
+                          or end_pos[0] not in (0, 7)):
+        return False
+
+    # Check if the move is valid
+    if not get_piece_moves(piece, board_obj, start_pos, color, end_pos):
+        return False
+
+    # The log keeps each move's undo record; a new move discards the redo line
+    board_obj.history.append(board_obj.make_move(move))
+    board_obj.redo_stack.clear()
+    count_position(board_obj, 1)
     return True
+
+
+def count_position(board_obj, change):
+    key = board_obj.zobrist_key
+    board_obj.position_counts[key] = board_obj.position_counts.get(key, 0) + change
+
+
+def logged_move(undo):
+    move = (SQUARE_POS[undo.start], SQUARE_POS[undo.end])
+    if undo.promoted and undo.promoted & TYPE_MASK != QUEEN:
+        move += (undo.promoted & TYPE_MASK,)
+    return move
+
+
+def undo_move(board_obj):
+    # Takes back the last logged move and returns it, or None at the start of the game
+    if not board_obj.history:
+        return None
+    undo = board_obj.history.pop()
+    count_position(board_obj, -1)
+    board_obj.unmake_move(undo)
+    board_obj.redo_stack.append(undo)
+    return logged_move(undo)
+
+
+def redo_move(board_obj):
+    # Replays the last undone move and returns it, or None if nothing was undone
+    if not board_obj.redo_stack:
+        return None
+    undo = board_obj.redo_stack.pop()
+    move = logged_move(undo)
+    board_obj.history.append(board_obj.make_move(move))
+    count_position(board_obj, 1)
+    return move
@@ -1,18 +1,21 @@
 from checkmate_logic import *
-from board import *
-import copy
+from pieces import (EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK, TYPE_MASK,
+                    COLOR_BITS, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)
+
+CASTLING_FLAGS = {
+    ('white', 'K'): WHITE_KINGSIDE,
+    ('white', 'Q'): WHITE_QUEENSIDE,
+    ('black', 'K'): BLACK_KINGSIDE,
+    ('black', 'Q'): BLACK_QUEENSIDE,
+}
 
 
 def is_empty(square):
-    return square in ['  ', '##']
+    return square == EMPTY
 
 
-def simulate_move(board, start_pos, end_pos):
-    temp_board = copy.deepcopy(board)
-    piece = temp_board[start_pos[0]][start_pos[1]]
-    temp_board[start_pos[0]][start_pos[1]] = '  ' if (start_pos[0] + start_pos[1]) % 2 else '##'
-    temp_board[end_pos[0]][end_pos[1]] = piece
-    return temp_board
+def is_capturable(target, color):
+    return target == EMPTY or (target & BLACK) != COLOR_BITS[color]
 
 
 def is_valid_pawn_move(board_obj,board, start_pos, end_pos, color):
@@ -21,19 +24,19 @@ def is_valid_pawn_move(board_obj,board, start_pos, end_pos, color):
     direction = -1 if color == 'white' else 1
 
     if start_col == end_col:
-        if end_row == start_row + direction and is_empty(board[end_row][end_col]):
+        if end_row == start_row + direction and is_empty(board[end_row * 8 + end_col]):
             return True
         if ((color == 'white' and start_row == 6) or (color == 'black' and start_row == 1)):
             if (end_row == start_row + 2 * direction and
-                    is_empty(board[start_row + direction][start_col]) and
-                    is_empty(board[end_row][end_col])):
+                    is_empty(board[(start_row + direction) * 8 + start_col]) and
+                    is_empty(board[end_row * 8 + end_col])):
                 return True
     if abs(start_col - end_col) == 1 and end_row == start_row + direction:
-        if board_obj.en_passant_target == (end_row, end_col):
+        if board_obj.en_passant_target == end_row * 8 + end_col:
             return True
     if abs(start_col - end_col) == 1 and end_row == start_row + direction:
-        target = board[end_row][end_col]
-        if not is_empty(target) and target[0].lower() != color[0].lower():
+        target = board[end_row * 8 + end_col]
+        if not is_empty(target) and is_capturable(target, color):
             return True
 
     return False
@@ -51,13 +54,12 @@ def is_valid_rook_move(board, start_pos, end_pos, color):
 
     row, col = start_row + step_row, start_col + step_col
     while (row, col) != (end_row, end_col):
-        if not is_empty(board[row][col]):
+        if not is_empty(board[row * 8 + col]):
             return False
         row += step_row
         col += step_col
 
-    target = board[end_row][end_col]
-    return is_empty(target) or target[0].lower() != color[0].lower()
+    return is_capturable(board[end_row * 8 + end_col], color)
 
 
 def is_valid_bishop_move(board, start_pos, end_pos, color):
@@ -72,13 +74,12 @@ def is_valid_bishop_move(board, start_pos, end_pos, color):
 
     row, col = start_row + step_row, start_col + step_col
     while (row, col) != (end_row, end_col):
-        if not is_empty(board[row][col]):
+        if not is_empty(board[row * 8 + col]):
             return False
         row += step_row
         col += step_col
 
-    target = board[end_row][end_col]
-    return is_empty(target) or target[0].lower() != color[0].lower()
+    return is_capturable(board[end_row * 8 + end_col], color)
 
 
 def is_valid_queen_move(board, start_pos, end_pos, color):
@@ -93,8 +94,7 @@ def is_valid_knight_move(board, start_pos, end_pos, color):
     if (abs(start_row - end_row), abs(start_col - end_col)) not in [(2, 1), (1, 2)]:
         return False
 
-    target = board[end_row][end_col]
-    return is_empty(target) or target[0].lower() != color[0].lower()
+    return is_capturable(board[end_row * 8 + end_col], color)
 
 
 def is_valid_king_move(board, start_pos, end_pos, color, board_obj):
@@ -103,8 +103,7 @@ def is_valid_king_move(board, start_pos, end_pos, color, board_obj):
 
     # Normal king move
     if max(abs(start_row - end_row), abs(start_col - end_col)) == 1:
-        target = board[end_row][end_col]
-        return is_empty(target) or target[0].lower() != color[0].lower()
+        return is_capturable(board[end_row * 8 + end_col], color)
 
     # Castling logic
     if start_row != end_row or abs(start_col - end_col) != 2:
@@ -114,11 +113,14 @@ def is_valid_king_move(board, start_pos, end_pos, color, board_obj):
         return False  # King cannot castle out of check
 
     castling_row = 7 if color == 'white' else 0
+    if start_pos != (castling_row, 4):
+        return False
+
     kingside = end_col > start_col
 
     # Check rights
     side = 'K' if kingside else 'Q'
-    if not board_obj.castling_rights[color][side]:
+    if not board_obj.castling_rights & CASTLING_FLAGS[(color, side)]:
         return False
 
     rook_col = 7 if kingside else 0
@@ -126,53 +128,48 @@ def is_valid_king_move(board, start_pos, end_pos, color, board_obj):
 
     # Check empty squares between king and rook
     for col in range(start_col + step, rook_col, step):
-        if not is_empty(board[castling_row][col]):
+        if not is_empty(board[castling_row * 8 + col]):
             return False
 
-    # Check squares the king crosses are not under attack
-    for col in range(start_col, end_col + step, step):
-        test_board = simulate_move(board, (start_row, start_col), (start_row, col))
-        temp_board_obj = copy.deepcopy(board_obj)
-        temp_board_obj.board = test_board
-        if is_in_check(temp_board_obj, color):
-            return False
+    # The square the king crosses must not be under attack
+    opponent = 'black' if color == 'white' else 'white'
+    if is_square_attacked(board_obj, castling_row * 8 + start_col + step, opponent):
+        return False
 
     return True
 
 
 
 def get_piece_moves(piece, board_obj, start_pos, color, end_pos):
-    board = board_obj.board if hasattr(board_obj, 'board') else board_obj
+    board = board_obj.squares
 
-    if piece.strip() == '' or piece == '##':
+    if is_empty(piece) or start_pos == end_pos:
         return False
 
-    if piece[0].lower() != color[0].lower():
+    if (piece & BLACK) != COLOR_BITS[color]:
         return False
 
-    piece_type = piece[1].lower()
+    piece_type = piece & TYPE_MASK
     move_is_valid = False
 
-    if piece_type == 'p':
+    if piece_type == PAWN:
         move_is_valid = is_valid_pawn_move(board_obj,board, start_pos, end_pos, color)
-    elif piece_type == 'r':
+    elif piece_type == ROOK:
         move_is_valid = is_valid_rook_move(board, start_pos, end_pos, color)
-    elif piece_type == 'b':
+    elif piece_type == BISHOP:
         move_is_valid = is_valid_bishop_move(board, start_pos, end_pos, color)
-    elif piece_type == 'q':
+    elif piece_type == QUEEN:
         move_is_valid = is_valid_queen_move(board, start_pos, end_pos, color)
-    elif piece_type == 'n':
+    elif piece_type == KNIGHT:
         move_is_valid = is_valid_knight_move(board, start_pos, end_pos, color)
-    elif piece_type == 'k':
+    elif piece_type == KING:
         move_is_valid = is_valid_king_move(board, start_pos, end_pos, color, board_obj)
 
     if not move_is_valid:
         return False
 
-    temp_board_obj = copy.deepcopy(board_obj)
-    temp_board_obj.board = simulate_move(board, start_pos, end_pos)
-
-    if is_in_check(temp_board_obj, color):
-        return False
+    undo = board_obj.make_move((start_pos, end_pos))
+    in_check = is_in_check(board_obj, color)
+    board_obj.unmake_move(undo)
 
-    return True
\ No newline at end of file
+    return not in_check
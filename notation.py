@@ -0,0 +1,93 @@
+import re
+
+from pieces import PAWN, KING, QUEEN, TYPE_MASK, PIECE_LETTERS
+
+LETTER_TYPES = {letter: piece_type for piece_type, letter in PIECE_LETTERS.items()}
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+def square_name(pos):
+    return chr(pos[1] + ord('a')) + str(8 - pos[0])
+
+
+def parse_square(text):
+    return (8 - int(text[1]), ord(text[0]) - ord('a'))
+
+
+def promotion_type(move):
+    return move[2] if len(move) > 2 else QUEEN
+
+
+def move_to_san(board_obj, move):
+    # Standard algebraic notation for a legal move of the side to move, with + or # added
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    squares = board_obj.squares
+    piece_type = squares[from_row * 8 + from_col] & TYPE_MASK
+    capture = squares[to_row * 8 + to_col] != 0
+    legal_moves = board_obj.get_all_legal_moves(board_obj.turn)
+
+    if piece_type == KING and abs(to_col - from_col) == 2:
+        text = 'O-O' if to_col > from_col else 'O-O-O'
+    elif piece_type == PAWN:
+        text = square_name(move[1])
+        if from_col != to_col:
+            text = chr(from_col + ord('a')) + 'x' + text
+        if to_row in (0, 7):
+            text += '=' + PIECE_LETTERS[promotion_type(move)]
+    else:
+        # Other pieces of the same type reaching the same square force a file or rank
+        rivals = [start for start, end, *_ in legal_moves
+                  if end == move[1] and start != move[0] and squares[start[0] * 8 + start[1]] & TYPE_MASK == piece_type]
+        prefix = ''
+        if rivals:
+            if all(start[1] != from_col for start in rivals):
+                prefix = chr(from_col + ord('a'))
+            elif all(start[0] != from_row for start in rivals):
+                prefix = str(8 - from_row)
+            else:
+                prefix = square_name(move[0])
+        text = PIECE_LETTERS[piece_type] + prefix + ('x' if capture else '') + square_name(move[1])
+
+    undo = board_obj.make_move(move)
+    try:
+        if board_obj.is_in_check(board_obj.turn):
+            text += '#' if not board_obj.get_all_legal_moves(board_obj.turn) else '+'
+    finally:
+        board_obj.unmake_move(undo)
+    return text
+
+
+def san_to_move(board_obj, text):
+    # The legal move of the side to move that the SAN text names; ValueError if there is
+    # no such move or more than one
+    san = text.rstrip('+#!?')
+    legal_moves = board_obj.get_all_legal_moves(board_obj.turn)
+    squares = board_obj.squares
+    if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        direction = 1 if san in ('O-O', '0-0') else -1
+        candidates = [move for move in legal_moves
+                      if squares[move[0][0] * 8 + move[0][1]] & TYPE_MASK == KING
+                      and move[1][1] - move[0][1] == 2 * direction]
+    else:
+        match = SAN_PATTERN.match(san)
+        if not match:
+            raise ValueError(f'not a SAN move: {text}')
+        letter, from_file, from_rank, target, promotion = match.groups()
+        piece_type = LETTER_TYPES[letter] if letter else PAWN
+        end = parse_square(target)
+        promoted = LETTER_TYPES[promotion] if promotion else QUEEN
+        candidates = []
+        for move in legal_moves:
+            (from_row, from_col), move_end = move[0], move[1]
+            if move_end != end or squares[from_row * 8 + from_col] & TYPE_MASK != piece_type:
+                continue
+            if from_file and chr(from_col + ord('a')) != from_file:
+                continue
+            if from_rank and str(8 - from_row) != from_rank:
+                continue
+            if piece_type == PAWN and end[0] in (0, 7) and promotion_type(move) != promoted:
+                continue
+            candidates.append(move)
+    if len(candidates) != 1:
+        raise ValueError(f'{"ambiguous" if candidates else "illegal"} move: {text}')
+    return candidates[0]
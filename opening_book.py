@@ -0,0 +1,60 @@
+import mmap
+import os
+import random
+import struct
+
+from transposition import encode_move, decode_move
+
+# Polyglot-style entries: key, move, weight, learn; sorted by key, heaviest move first.
+# The key is our Zobrist key and the move uses the transposition table's encoding
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+
+def write_book(path, counts):
+    # counts: {key: {move: weight}}
+    with open(path, 'wb') as book:
+        for key in sorted(counts):
+            for move, weight in sorted(counts[key].items(), key=lambda item: -item[1]):
+                book.write(ENTRY.pack(key, encode_move(move), min(weight, 0xFFFF), 0))
+
+
+class OpeningBook:
+    # Read-only view of a book file; lookups binary-search the mapped entries
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as book:
+            size = os.fstat(book.fileno()).st_size
+            self.data = mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.entries = size // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def lookup(self, key):
+        # Returns [(move, weight)] stored for the key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.entries:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((decode_move(move), weight))
+            low += 1
+        return moves
+
+    def choose(self, board_obj, color, rng=random):
+        # A legal book move for color, picked with probability by weight, or None
+        legal = set(board_obj.get_all_legal_moves(color))
+        moves = [(move, weight) for move, weight in self.lookup(board_obj.zobrist_key)
+                 if move in legal and weight]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
@@ -0,0 +1,254 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import ai
+from board import Board
+from utils import switch_turn
+from ai import (CHECKMATE, MAX_DEPTH, AI_TIME_LIMIT, SearchState, SearchTimeout, negamax, order_moves,
+                get_all_possible_moves, get_ai_move)
+from search_stats import SearchStats
+
+STOP_POLL_SECONDS = 0.05  # How often a search waiting on its workers checks its stop event
+
+# Worker processes are started fresh rather than forked from a window-owning parent.
+# Each pool comes with an event its workers' searches stop on
+_pools = {}
+_worker_stop = None
+
+
+def init_worker(stop_signal):
+    global _worker_stop
+    _worker_stop = stop_signal
+
+
+def get_pool(workers):
+    # (executor, stop signal) for that many workers
+    if workers not in _pools:
+        context = multiprocessing.get_context('spawn')
+        stop_signal = context.Event()
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                       initargs=(stop_signal,))
+        _pools[workers] = (executor, stop_signal)
+    return _pools[workers]
+
+
+def shutdown_pools():
+    for pool, stop_signal in _pools.values():
+        stop_signal.set()
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+
+SEARCH_FLAGS = ('USE_PVS', 'USE_ASPIRATION', 'USE_NULL_MOVE', 'USE_LMR', 'USE_DELTA_PRUNING')
+
+
+def search_root_move(encoded, move, depth, alpha, beta, deadline, max_nodes, deterministic, flags, table_mb,
+                     stop_event=None):
+    # Runs in a worker: scores one root move for the side to move in the encoded position.
+    # Returns (score, nodes), with score None when the deadline, the node budget or the
+    # stop event cut it short
+    for name, value in zip(SEARCH_FLAGS, flags):
+        setattr(ai, name, value)  # Workers follow the flags set in the parent
+    board_obj = Board.decode(encoded)
+    if deterministic:
+        # A fresh table the parent's size makes the score depend on nothing but the
+        # position and move, the same as in ai.search_root_exact
+        ai.transposition_table.resize(table_mb)
+    time_limit = None if deadline is None else max(0.0, deadline - time.time())
+    state = SearchState(time_limit, max_nodes, stop_event or _worker_stop)
+    state.root_depth = depth
+    board_obj.make_move(move)
+    try:
+        score, _ = negamax(board_obj, depth - 1, -beta, -alpha, board_obj.turn, state, 1)
+    except SearchTimeout:
+        return None, state.nodes
+    return -score, state.nodes
+
+
+def collect(futures, stop_signal, stop_event):
+    # Waits for the futures. Once stop_event is set the queued ones are cancelled and the
+    # running ones stopped through the pool's stop signal
+    pending = futures
+    while pending:
+        _, pending = wait(pending, STOP_POLL_SECONDS if stop_event is not None else None)
+        if pending and stop_event.is_set():
+            for future in pending:
+                future.cancel()
+            stop_signal.set()
+            wait(pending)
+            stop_signal.clear()
+            raise SearchTimeout()
+    return [future.result() for future in futures]
+
+
+def run_tasks(pool, tasks, state):
+    # Scores (encoded, move, depth, alpha, beta, deterministic) tasks within the budget of
+    # the parent's SearchState, adding their nodes to it. Without a pool the tasks run
+    # here, one after another. Raises SearchTimeout when any of them was cut short
+    flags = tuple(getattr(ai, name) for name in SEARCH_FLAGS)
+    table_mb = ai.transposition_table.size_mb
+    max_nodes = None if state.max_nodes is None else max(state.max_nodes - state.nodes, 0)
+    tasks = [(encoded, move, depth, alpha, beta, state.deadline, max_nodes, deterministic)
+             for encoded, move, depth, alpha, beta, deterministic in tasks]
+    if pool is None:
+        results = [search_root_move(*task, flags, table_mb, state.stop_event) for task in tasks]
+    else:
+        executor, stop_signal = pool
+        results = collect([executor.submit(search_root_move, *task, flags, table_mb) for task in tasks],
+                          stop_signal, state.stop_event)
+    state.nodes += sum(count for _, count in results)
+    if any(score is None for score, _ in results):
+        raise SearchTimeout()
+    if state.max_nodes is not None and state.nodes > state.max_nodes:
+        raise SearchTimeout()  # Tasks running side by side each had the whole budget left
+    return [score for score, _ in results]
+
+
+def search_root_moves(encoded, moves, depth, pool, state, deterministic):
+    # Returns a score per move. In deterministic mode every move is searched on its own
+    # with a full window; otherwise the first move sets alpha and the rest only have to
+    # refute it with a null window, re-searching those that fail high
+    if deterministic:
+        return run_tasks(pool, [(encoded, move, depth, -math.inf, math.inf, True) for move in moves], state)
+
+    scores = run_tasks(pool, [(encoded, moves[0], depth, -math.inf, math.inf, False)], state)
+    first = alpha = scores[0]
+    scores += run_tasks(pool, [(encoded, move, depth, alpha, alpha + 1, False) for move in moves[1:]], state)
+    # Every null-window score above the first move's is only a lower bound, whatever
+    # alpha has risen to since
+    for index, score in enumerate(scores):
+        if index and score > first:
+            scores[index] = run_tasks(pool, [(encoded, moves[index], depth, alpha, math.inf, False)], state)[0]
+            alpha = max(alpha, scores[index])
+    return scores
+
+
+def get_parallel_move(board_obj, color, workers=None, time_limit=AI_TIME_LIMIT, max_depth=MAX_DEPTH,
+                      deterministic=False, return_stats=False, progress_hook=None, max_nodes=None,
+                      stop_event=None):
+    # Iterative deepening with the root moves of each depth split across worker processes.
+    # With return_stats also returns SearchStats built from the workers' node counts;
+    # progress_hook gets the stats so far after every completed depth. The time limit,
+    # node budget and stop event end the search as in get_ai_move
+    state = SearchState(time_limit, max_nodes, stop_event)
+    ai.transposition_table.reset_counters()  # The workers' tables are not counted
+    valid_moves = get_all_possible_moves(board_obj, color)
+    if not valid_moves:
+        stats = SearchStats(state, ai.transposition_table, None, None, 0, time.time() - state.start_time)
+        return (None, stats) if return_stats else None
+
+    workers = workers or os.cpu_count() or 1
+    pool = get_pool(workers) if workers > 1 else None
+    start_time = state.start_time
+    encoded = board_obj.encode()
+
+    # Later depths try the moves in the order of the previous depth's scores; the sort
+    # is stable so equal scores keep their order and the first best move wins. In
+    # deterministic mode the moves stay in generation order, which breaks ties the way
+    # ai.search_root_exact does
+    moves = valid_moves if deterministic else order_moves(valid_moves, board_obj, color)
+    best_move = moves[0]
+    best_score = None
+    completed_depth = 0
+    previous_settings = ai.apply_settings(ai.DETERMINISTIC_SETTINGS) if deterministic else {}
+    try:
+        for depth in range(1, max_depth + 1):
+            nodes_before = state.nodes
+            try:
+                scores = search_root_moves(encoded, moves, depth, pool, state, deterministic)
+            except SearchTimeout:
+                break
+            state.iteration_nodes.append(state.nodes - nodes_before)
+            ranked = sorted(zip(scores, range(len(moves))), key=lambda item: -item[0])
+            best_score, best_index = ranked[0]
+            best_move = moves[best_index]
+            if not deterministic:
+                moves = [moves[index] for _, index in ranked]
+            completed_depth = depth
+            state.root_depth = depth
+            state.pv = [best_move]
+            if progress_hook is not None:
+                progress_hook(SearchStats(state, ai.transposition_table, best_move, best_score, depth,
+                                          time.time() - start_time))
+            if abs(best_score) >= -CHECKMATE:
+                break
+    finally:
+        ai.apply_settings(previous_settings)
+
+    stats = SearchStats(state, ai.transposition_table, best_move, best_score, completed_depth,
+                        time.time() - start_time)
+    if ai.VERBOSE:
+        print(f"AI Move Time: {stats.seconds:.2f}s (depth {completed_depth}, {stats.nodes} nodes, "
+              f"{stats.nps:.0f} nps, {workers} workers)")
+    return (best_move, stats) if return_stats else best_move
+
+
+def play_line(line):
+    board_obj = Board()
+    color = 'white'
+    for move in line.split():
+        start = (8 - int(move[1]), ord(move[0]) - ord('a'))
+        end = (8 - int(move[3]), ord(move[2]) - ord('a'))
+        board_obj.make_move((start, end))
+        color = switch_turn(color)
+    return board_obj, color
+
+
+BENCHMARK_LINES = (
+    '',
+    'e2e4 e7e5 g1f3 b8c6 f1c4 g8f6',
+    'd2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7',
+    'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3',
+    'e2e4 e7e5 f1c4 b8c6 d1h5 g8f6',  # Qxf7# is the one mating move; Bxf7+ is ordered first
+)
+
+
+def benchmark(depth=4, workers=None):
+    # Times each mode with one worker and with many at a fixed depth, and compares both
+    # modes with the serial get_ai_move. The deterministic mode must return its move; the
+    # default mode's pruning and the workers' own tables may settle on another move of
+    # about the same score, so it only has to agree where the serial search finds a mate
+    workers = workers or os.cpu_count() or 1
+    get_parallel_move(Board(), 'white', workers, None, 1)  # Start the pool before timing
+    totals = {}
+    matches = {'one_worker': 0, 'get_ai_move': 0, 'default_get_ai_move': 0}
+    for line in BENCHMARK_LINES:
+        board_obj, color = play_line(line)
+        moves = {}
+        for deterministic in (True, False):
+            for count in (1, workers):
+                started = time.time()
+                moves[deterministic, count] = get_parallel_move(board_obj, color, count, None, depth,
+                                                                deterministic)
+                totals[deterministic, count] = totals.get((deterministic, count), 0.0) + time.time() - started
+        serial = {}
+        use_book, ai.USE_BOOK = ai.USE_BOOK, False  # Compare searches, not book moves
+        try:
+            for deterministic in (True, False):
+                ai.transposition_table.clear()
+                serial[deterministic] = get_ai_move(board_obj, color, None, max_depth=depth, workers=1,
+                                                    return_stats=True, deterministic=deterministic)
+        finally:
+            ai.USE_BOOK = use_book
+        matches['one_worker'] += moves[True, 1] == moves[True, workers]
+        matches['get_ai_move'] += moves[True, workers] == serial[True][0]
+        assert moves[True, workers] == serial[True][0], (line, moves[True, workers], serial[True][0])
+        default_move, default_stats = serial[False]
+        matches['default_get_ai_move'] += moves[False, workers] == default_move
+        if abs(default_stats.score) >= -CHECKMATE:
+            for count in (1, workers):
+                assert moves[False, count] == default_move, (line, count, moves[False, count], default_move)
+    return {
+        'workers': workers,
+        'positions': len(BENCHMARK_LINES),
+        'matches': matches,
+        'deterministic_speedup': round(totals[True, 1] / totals[True, workers], 2),
+        'parallel_speedup': round(totals[False, 1] / totals[False, workers], 2),
+    }
+
+if __name__ == '__main__':
+    print(benchmark())
+    shutdown_pools()
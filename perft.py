@@ -0,0 +1,135 @@
+import argparse
+import time
+
+from board import Board
+from bitboard import BitBoard
+
+# (name, FEN, {depth: leaf nodes}) with published counts
+POSITIONS = (
+    ('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -',
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('rook endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq -',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('promotions mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ -',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('discovered checks', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ -',
+     {1: 44, 2: 1486, 3: 62379}),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - -',
+     {1: 46, 2: 2079, 3: 89890}),
+    # Edge cases: en passant that would expose the king, castling rights and promotions
+    ('illegal en passant', '3k4/3p4/8/K1P4r/8/8/8/8 b - -', {6: 1134888}),
+    ('en passant pin', '8/8/4k3/8/2p5/8/B2P2K1/8 w - -', {6: 1015133}),
+    ('en passant capture checker', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3', {6: 1440467}),
+    ('short castling gives check', '5k2/8/8/8/8/8/8/4K2R w K -', {6: 661072}),
+    ('long castling gives check', '3k4/8/8/8/8/8/8/R3K3 w Q -', {6: 803711}),
+    ('castle rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq -', {4: 1274206}),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq -', {4: 1720476}),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - -', {6: 3821001}),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - -', {5: 1004658}),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - -', {6: 217342}),
+    ('underpromote to check', '8/P1k5/K7/8/8/8/8/8 w - -', {6: 92683}),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - -', {6: 2217}),
+    ('stalemate and checkmate', '8/k1P5/8/1K6/8/8/8/8 w - -', {7: 567584}),
+    ('checkmate and stalemate', '8/8/2k5/5q2/5n2/8/5K2/8 b - -', {4: 23527}),
+)
+
+
+def perft(board_obj, depth, validate=False):
+    # Counts the leaf nodes of the legal move tree. With validate, every move goes through
+    # move_piece, so move_validation must accept everything the generator produces
+    color = board_obj.turn
+    moves = board_obj.get_all_legal_moves(color)
+    if depth <= 1 and not validate:
+        return len(moves) if depth == 1 else 1
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in moves:
+        if validate:
+            assert board_obj.move_piece(move, color), move
+            nodes += perft(board_obj, depth - 1, validate)
+            board_obj.undo()
+        else:
+            undo = board_obj.make_move(move)
+            nodes += perft(board_obj, depth - 1)
+            board_obj.unmake_move(undo)
+    return nodes
+
+
+def divide(board_obj, depth):
+    # Leaf counts below each root move, for finding where two generators disagree
+    counts = {}
+    for move in board_obj.get_all_legal_moves(board_obj.turn):
+        undo = board_obj.make_move(move)
+        counts[move] = perft(board_obj, depth - 1)
+        board_obj.unmake_move(undo)
+    return counts
+
+
+def run_suite(board_class=Board, max_nodes=100000, validate=False):
+    # Runs each position at its deepest known depth within max_nodes and yields
+    # (name, depth, expected, nodes, seconds)
+    for name, fen, counts in POSITIONS:
+        depths = [depth for depth, expected in counts.items() if expected <= max_nodes]
+        if not depths:
+            continue
+        depth = max(depths)
+        board_obj = board_class.from_fen(fen)
+        started = time.time()
+        nodes = perft(board_obj, depth, validate)
+        yield name, depth, counts[depth], nodes, time.time() - started
+
+
+def algebraic(move):
+    text = ''.join(chr(col + ord('a')) + str(8 - row) for row, col in move[:2])
+    return text + ('nbrq'[move[2] - 2] if len(move) > 2 else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count move generation leaf nodes.')
+    parser.add_argument('--fen', help='position to count instead of the standard suite')
+    parser.add_argument('--depth', type=int, default=3, help='depth for --fen')
+    parser.add_argument('--divide', action='store_true', help='with --fen, print counts per root move')
+    parser.add_argument('--max-nodes', type=int, default=100000,
+                        help='deepest known count per suite position to run')
+    parser.add_argument('--bitboard', action='store_true', help='use the BitBoard backend')
+    parser.add_argument('--validate', action='store_true',
+                        help='play moves through move_piece to check move_validation too')
+    args = parser.parse_args()
+    board_class = BitBoard if args.bitboard else Board
+
+    if args.fen:
+        board_obj = board_class.from_fen(args.fen)
+        started = time.time()
+        if args.divide:
+            counts = divide(board_obj, args.depth)
+            for move, count in sorted(counts.items(), key=lambda item: algebraic(item[0])):
+                print(f'{algebraic(move)}: {count}')
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(board_obj, args.depth, args.validate)
+        elapsed = time.time() - started
+        print(f'nodes {nodes}  time {elapsed:.2f}s  nps {nodes / max(elapsed, 1e-9):.0f}')
+        return
+
+    total_nodes = 0
+    total_time = 0.0
+    failures = 0
+    for name, depth, expected, nodes, elapsed in run_suite(board_class, args.max_nodes, args.validate):
+        result = 'ok' if nodes == expected else f'FAIL (expected {expected})'
+        failures += nodes != expected
+        total_nodes += nodes
+        total_time += elapsed
+        nps = nodes / max(elapsed, 1e-9)
+        print(f'{name:28} depth {depth}  {nodes:>9}  {elapsed:6.2f}s  {nps:>8.0f} nps  {result}')
+    print(f'total {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nps, '
+          f'{failures} failed')
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
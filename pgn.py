@@ -0,0 +1,157 @@
+import argparse
+import json
+import re
+import time
+
+import ai
+from board import Board
+
+RESULTS = frozenset(('1-0', '0-1', '1/2-1/2', '*'))
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN = re.compile(r'[{}();]|[^\s{}();]+')
+MOVE_NUMBER = re.compile(r'^\d+\.*')
+ANALYSIS_DEPTH = 3
+
+
+class PgnGame:
+    # Tag pairs, SAN moves of the main line and the result token of one game
+    __slots__ = ('headers', 'moves', 'result')
+
+    def __init__(self):
+        self.headers = {}
+        self.moves = []
+        self.result = '*'
+
+    def start_board(self):
+        fen = self.headers.get('FEN')
+        return Board.from_fen(fen) if fen else Board()
+
+
+def read_games(path):
+    # Yields one PgnGame at a time, so only the game being read is held in memory.
+    # Comments, variations and numeric annotations are skipped
+    game = PgnGame()
+    in_comment = False
+    variation_depth = 0
+    in_movetext = False
+    with open(path, encoding='utf-8', errors='replace') as pgn_file:
+        for line in pgn_file:
+            if not in_comment and line.startswith('%'):
+                continue
+            if not in_comment and variation_depth == 0 and line.lstrip().startswith('['):
+                if in_movetext:
+                    # A game without a result token
+                    yield game
+                    game = PgnGame()
+                    in_movetext = False
+                for name, value in TAG.findall(line):
+                    game.headers[name] = value.replace('\\"', '"').replace('\\\\', '\\')
+                continue
+            for token in TOKEN.findall(line):
+                if in_comment:
+                    in_comment = token != '}'
+                elif token == '{':
+                    in_comment = True
+                elif token == ';':
+                    break
+                elif token == '(':
+                    variation_depth += 1
+                elif token == ')':
+                    variation_depth = max(variation_depth - 1, 0)
+                elif variation_depth or token.startswith('$'):
+                    continue
+                elif token in RESULTS:
+                    game.result = token
+                    yield game
+                    game = PgnGame()
+                    in_movetext = False
+                else:
+                    move = MOVE_NUMBER.sub('', token)
+                    if move:
+                        game.moves.append(move)
+                        in_movetext = True
+    if in_movetext or game.headers:
+        yield game
+
+
+def replay(game, max_plies=None):
+    # Yields (board, move) before each move of the game, then plays the move through
+    # move_piece. A SAN move that is illegal in the position raises ValueError
+    board_obj = game.start_board()
+    for san in game.moves[:max_plies]:
+        move = board_obj.parse_san(san)
+        yield board_obj, move
+        if not board_obj.move_piece(move, board_obj.turn):
+            raise ValueError(f'move_piece rejected {san}')
+
+
+def move_lists(path, max_plies=None):
+    # Games as lists of moves for book_builder.build_book, cut short at the first illegal
+    # move
+    for game in read_games(path):
+        moves = []
+        try:
+            for _, move in replay(game, max_plies):
+                moves.append(move)
+        except ValueError:
+            pass
+        yield moves
+
+
+def analyze_game(game, max_depth=ANALYSIS_DEPTH, time_limit=None):
+    # Searches every position of the game and yields one record per ply comparing the
+    # played move with the engine's choice. Scores are for the side to move
+    for ply, (board_obj, move) in enumerate(replay(game)):
+        best, stats = ai.get_ai_move(board_obj, board_obj.turn, time_limit, max_depth=max_depth,
+                                     return_stats=True)
+        yield {'ply': ply, 'fen': board_obj.to_fen(), 'played': board_obj.san(move),
+               'best': board_obj.san(best) if best is not None else None, 'score': stats.score,
+               'depth': stats.depth, 'nodes': stats.nodes}
+
+
+def analyze_games(paths, output_path, max_depth=ANALYSIS_DEPTH, time_limit=None, max_games=None):
+    # Streams games from the PGN files through the engine and appends one JSON line per
+    # position to output_path. Returns (games, positions, games with an illegal move)
+    games = positions = errors = 0
+    verbose = ai.VERBOSE
+    ai.VERBOSE = False
+    try:
+        with open(output_path, 'a') as output:
+            for path in paths:
+                for game in read_games(path):
+                    if max_games is not None and games >= max_games:
+                        return games, positions, errors
+                    try:
+                        for record in analyze_game(game, max_depth, time_limit):
+                            record['game'] = games
+                            output.write(json.dumps(record) + '\n')
+                            positions += 1
+                    except ValueError as error:
+                        output.write(json.dumps({'game': games, 'error': str(error)}) + '\n')
+                        errors += 1
+                    games += 1
+    finally:
+        ai.VERBOSE = verbose
+    return games, positions, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the engine over every position of PGN games.')
+    parser.add_argument('pgn', nargs='+', help='PGN files to read')
+    parser.add_argument('--output', required=True, help='JSON lines file to append results to')
+    parser.add_argument('--depth', type=int, default=ANALYSIS_DEPTH, help='search depth per position')
+    parser.add_argument('--movetime', type=float, help='seconds per position, on top of --depth')
+    parser.add_argument('--max-games', type=int, help='stop after this many games')
+    parser.add_argument('--book', action='store_true', help='answer from the opening book where it can')
+    args = parser.parse_args()
+    ai.USE_BOOK = args.book
+
+    started = time.time()
+    games, positions, errors = analyze_games(args.pgn, args.output, args.depth, args.movetime, args.max_games)
+    elapsed = time.time() - started
+    print(f'{games} games, {positions} positions, {errors} with illegal moves in {elapsed:.1f}s '
+          f'({positions / max(elapsed, 1e-9):.1f} positions/s)')
+
+
+if __name__ == '__main__':
+    main()
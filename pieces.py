@@ -0,0 +1,51 @@
+# Integer piece codes stored in Board.squares: low three bits are the piece
+# type, bit 3 is set for black pieces
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+
+WHITE = 0
+BLACK = 8
+TYPE_MASK = 7
+
+COLOR_BITS = {'white': WHITE, 'black': BLACK}
+
+# Castling rights as bit flags
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+
+# A move is (start, end) with (row, col) squares; a pawn reaching the last rank becomes a
+# queen unless the move carries one of these types as a third element
+UNDERPROMOTIONS = (KNIGHT, BISHOP, ROOK)
+
+PIECE_LETTERS = {PAWN: 'P', KNIGHT: 'N', BISHOP: 'B', ROOK: 'R', QUEEN: 'Q', KING: 'K'}
+
+# Two-character names used by the UI, e.g. 'wQ' or 'bP'
+PIECE_NAMES = {}
+for _piece_type, _letter in PIECE_LETTERS.items():
+    PIECE_NAMES[WHITE | _piece_type] = 'w' + _letter
+    PIECE_NAMES[BLACK | _piece_type] = 'b' + _letter
+PIECE_CODES = {name: code for code, name in PIECE_NAMES.items()}
+
+# Square index is row * 8 + col, row 0 being black's back rank
+SQUARE_POS = tuple(divmod(square, 8) for square in range(64))
+
+
+def square_index(pos):
+    return pos[0] * 8 + pos[1]
+
+
+def piece_color(piece):
+    return 'black' if piece & BLACK else 'white'
+
+
+def empty_square_name(square):
+    row, col = SQUARE_POS[square]
+    return '  ' if (row + col) % 2 == 0 else '##'
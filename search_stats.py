@@ -0,0 +1,56 @@
+import json
+
+
+class SearchStats:
+    # What one call to get_ai_move did, for logging and latency tuning
+    __slots__ = ('move', 'score', 'depth', 'pv', 'nodes', 'qnodes', 'seconds', 'nps', 'tt_probes',
+                 'tt_hits', 'tt_collisions', 'cutoffs', 'first_move_cutoffs', 'first_move_cutoff_rate',
+                 'branching_factor', 'iteration_nodes', 'movegen_seconds', 'ordering_seconds',
+                 'eval_seconds')
+
+    def __init__(self, state, table, move, score, depth, seconds):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.pv = list(state.pv)
+        self.nodes = state.nodes
+        self.qnodes = state.qnodes
+        self.seconds = seconds
+        self.nps = state.nodes / seconds if seconds > 0 else 0.0
+        self.tt_probes = table.probes
+        self.tt_hits = table.hits
+        self.tt_collisions = table.collisions
+        self.cutoffs = state.cutoffs
+        self.first_move_cutoffs = state.first_move_cutoffs
+        self.first_move_cutoff_rate = state.first_move_cutoffs / state.cutoffs if state.cutoffs else 0.0
+        # Nodes of each completed iteration; the last two give the effective branching factor
+        self.iteration_nodes = list(state.iteration_nodes)
+        if len(self.iteration_nodes) >= 2 and self.iteration_nodes[-2]:
+            self.branching_factor = self.iteration_nodes[-1] / self.iteration_nodes[-2]
+        else:
+            self.branching_factor = 0.0
+        self.movegen_seconds = state.movegen_time
+        self.ordering_seconds = state.ordering_time
+        self.eval_seconds = state.eval_time
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['tt_hit_rate'] = self.tt_hit_rate
+        return data
+
+    def summary(self):
+        return (f"AI Move Time: {self.seconds:.2f}s (depth {self.depth}, {self.nodes} nodes, "
+                f"{self.qnodes} in quiescence, {self.nps:.0f} nps, TT hits {self.tt_hit_rate:.0%}, "
+                f"first-move cutoffs {self.first_move_cutoff_rate:.0%}, EBF {self.branching_factor:.1f})")
+
+
+def jsonl_hook(path):
+    # Returns a stats hook that appends one JSON object per search to the file
+    def write(stats):
+        with open(path, 'a') as log:
+            log.write(json.dumps(stats.to_dict()) + '\n')
+    return write
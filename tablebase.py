@@ -0,0 +1,401 @@
+import mmap
+import os
+import sys
+import time
+
+from attack_tables import KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, SLIDER_RAYS, \
+    PAWN_ATTACKER_SQUARES
+from pieces import EMPTY, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, TYPE_MASK, \
+    PIECE_LETTERS, UNDERPROMOTIONS
+
+# Distance-to-mate tables for endings with few pieces, one file per material signature
+# such as 'KQK' (white's pieces, then black's). A table holds one byte per index of
+# (side to move, square of each piece): DRAW for draws and impossible positions, otherwise
+# the distance to mate in plies plus one. Odd distances are wins for the side to move.
+# Positions with the stronger side as black are probed colour-flipped
+MAX_PIECES = 4
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+DRAW = 0
+# No mate is possible, so these need no file
+TRIVIAL_DRAWS = frozenset(('KK', 'KBK', 'KNK'))
+
+# Values used only while generating
+UNKNOWN = 255
+ILLEGAL = 254
+
+LETTER_TYPES = {letter: piece_type for piece_type, letter in PIECE_LETTERS.items()}
+KNIGHT_SETS = tuple(frozenset(targets) for targets in KNIGHT_TARGETS)
+KING_SETS = tuple(frozenset(targets) for targets in KING_TARGETS)
+
+
+def build_lines():
+    # [origin][target]: (ROOK or BISHOP, squares in between) when a slider on origin
+    # could reach target, otherwise None
+    lines = [[None] * 64 for _ in range(64)]
+    for kind, ray_table in ((ROOK, ROOK_RAYS), (BISHOP, BISHOP_RAYS)):
+        for origin in range(64):
+            for ray in ray_table[origin]:
+                for distance, target in enumerate(ray):
+                    lines[origin][target] = (kind, ray[:distance])
+    return lines
+
+
+LINES = build_lines()
+# Squares a pawn of each colour captures on from each square
+PAWN_CAPTURES = {color: tuple(tuple(target for target in range(64) if origin in PAWN_ATTACKER_SQUARES[color][target])
+                              for origin in range(64))
+                 for color in (WHITE, BLACK)}
+PAWN_STEPS = {WHITE: -8, BLACK: 8}
+PAWN_START_ROWS = {WHITE: 6, BLACK: 1}
+
+# Opened tables by path; None for files that do not exist
+tables = {}
+
+
+def material_name(codes):
+    return ''.join(PIECE_LETTERS[code & TYPE_MASK] for code in codes)
+
+
+def table_codes(name):
+    # 'KRKN' -> piece codes in index order: white king, white pieces, black king, black pieces
+    split = name.index('K', 1)
+    return ([WHITE | LETTER_TYPES[letter] for letter in name[:split]] +
+            [BLACK | LETTER_TYPES[letter] for letter in name[split:]])
+
+
+def canonical(pieces, side):
+    # (name, squares, side) for [(code, square)] pieces with the stronger side as white,
+    # ordered king first and then by descending piece type
+    white = sorted((code & TYPE_MASK for code, _ in pieces if not code & BLACK and code & TYPE_MASK != KING),
+                   reverse=True)
+    black = sorted((code & TYPE_MASK for code, _ in pieces if code & BLACK and code & TYPE_MASK != KING),
+                   reverse=True)
+    if black > white:
+        pieces = [(code ^ BLACK, square ^ 56) for code, square in pieces]
+        side ^= BLACK
+    pieces = sorted(pieces, key=lambda item: (item[0] & BLACK, -(item[0] & TYPE_MASK), item[1]))
+    return (material_name([code for code, _ in pieces]), tuple(square for _, square in pieces), side)
+
+
+def position_index(squares, side):
+    index = 1 if side == BLACK else 0
+    for square in reversed(squares):
+        index = index << 6 | square
+    return index
+
+
+def table_path(name, directory=TABLE_DIR):
+    return os.path.join(directory, name + '.tb')
+
+
+def open_table(name, directory=TABLE_DIR):
+    path = table_path(name, directory)
+    if path not in tables:
+        table = None
+        if os.path.exists(path):
+            with open(path, 'rb') as table_file:
+                table = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        tables[path] = table
+    return tables[path]
+
+
+def close_tables():
+    for table in tables.values():
+        if table is not None:
+            table.close()
+    tables.clear()
+
+
+def lookup(pieces, side, directory=TABLE_DIR):
+    # The stored byte for [(code, square)] pieces with side (WHITE or BLACK) to move,
+    # or None when there is no table for the material
+    name, squares, side = canonical(pieces, side)
+    if name in TRIVIAL_DRAWS:
+        return DRAW
+    table = open_table(name, directory)
+    if table is None:
+        return None
+    return table[position_index(squares, side)]
+
+
+def probe(board_obj, directory=TABLE_DIR):
+    # (result, plies to mate) for the side to move, result being 1 for a win, 0 for a
+    # draw and -1 for a loss; None when no table covers the position. Tables know
+    # nothing of castling or en passant, so positions where either is possible are left out
+    if board_obj.castling_rights:
+        return None
+    side = BLACK if board_obj.turn == 'black' else WHITE
+    squares = board_obj.squares
+    if board_obj.en_passant_target is not None:
+        for square in PAWN_ATTACKER_SQUARES[side][board_obj.en_passant_target]:
+            if squares[square] == side | PAWN:
+                return None
+    pieces = [(piece, square) for square, piece in enumerate(squares) if piece != EMPTY]
+    if len(pieces) > MAX_PIECES:
+        return None
+    value = lookup(pieces, side, directory)
+    if value is None:
+        return None
+    if value == DRAW:
+        return 0, 0
+    distance = value - 1
+    return (1 if distance % 2 else -1), distance
+
+
+def best_move(board_obj, directory=TABLE_DIR):
+    # The legal move with the best table result: the fastest win, the slowest loss or a
+    # draw. None when the position or one of its successors is not covered
+    if probe(board_obj, directory) is None:
+        return None
+    best = None
+    best_key = None
+    for move in board_obj.get_all_legal_moves(board_obj.turn):
+        undo = board_obj.make_move(move)
+        try:
+            child = probe(board_obj, directory)
+        finally:
+            board_obj.unmake_move(undo)
+        if child is None:
+            return None
+        result, distance = child
+        # Ranked from our side: a lost child is our win, sooner being better
+        key = (-result, -distance if result < 0 else distance)
+        if best_key is None or key > best_key:
+            best, best_key = move, key
+    return best
+
+
+def is_attacked(square, by_color, pieces, occupied):
+    for code, origin in pieces:
+        if code & BLACK != by_color:
+            continue
+        piece_type = code & TYPE_MASK
+        if piece_type == KING:
+            if square in KING_SETS[origin]:
+                return True
+        elif piece_type == KNIGHT:
+            if square in KNIGHT_SETS[origin]:
+                return True
+        elif piece_type == PAWN:
+            if origin in PAWN_ATTACKER_SQUARES[by_color][square]:
+                return True
+        else:
+            line = LINES[origin][square]
+            if (line is not None and (piece_type == QUEEN or piece_type == line[0])
+                    and not any(between in occupied for between in line[1])):
+                return True
+    return False
+
+
+def piece_moves(code, origin, owners, codes):
+    # (target, captured index or None) for the piece, ignoring checks
+    color = code & BLACK
+    piece_type = code & TYPE_MASK
+    moves = []
+    if piece_type == PAWN:
+        step = origin + PAWN_STEPS[color]
+        if step not in owners:
+            moves.append((step, None))
+            double = step + PAWN_STEPS[color]
+            if origin // 8 == PAWN_START_ROWS[color] and double not in owners:
+                moves.append((double, None))
+        for target in PAWN_CAPTURES[color][origin]:
+            if target in owners and codes[owners[target]] & BLACK != color:
+                moves.append((target, owners[target]))
+    elif piece_type == KING or piece_type == KNIGHT:
+        for target in (KING_TARGETS if piece_type == KING else KNIGHT_TARGETS)[origin]:
+            if target not in owners:
+                moves.append((target, None))
+            elif codes[owners[target]] & BLACK != color:
+                moves.append((target, owners[target]))
+    else:
+        for ray in SLIDER_RAYS[piece_type][origin]:
+            for target in ray:
+                if target not in owners:
+                    moves.append((target, None))
+                    continue
+                if codes[owners[target]] & BLACK != color:
+                    moves.append((target, owners[target]))
+                break
+    return moves
+
+
+def piece_unmoves(code, origin, occupied):
+    # Squares the piece could have come from without capturing or promoting
+    color = code & BLACK
+    piece_type = code & TYPE_MASK
+    if piece_type == PAWN:
+        back = -PAWN_STEPS[color]
+        source = origin + back
+        if source in occupied or not 1 <= source // 8 <= 6:
+            return []
+        sources = [source]
+        if source // 8 + back // 8 == PAWN_START_ROWS[color] and source + back not in occupied:
+            sources.append(source + back)
+        return sources
+    if piece_type == KING or piece_type == KNIGHT:
+        return [source for source in (KING_TARGETS if piece_type == KING else KNIGHT_TARGETS)[origin]
+                if source not in occupied]
+    sources = []
+    for ray in SLIDER_RAYS[piece_type][origin]:
+        for source in ray:
+            if source in occupied:
+                break
+            sources.append(source)
+    return sources
+
+
+def is_legal(codes, squares, side):
+    # Distinct squares, no pawn on a back rank and the side not to move not in check
+    if len(set(squares)) != len(squares):
+        return False
+    for code, square in zip(codes, squares):
+        if code & TYPE_MASK == PAWN and square // 8 in (0, 7):
+            return False
+    king = codes.index((side ^ BLACK) | KING)
+    return not is_attacked(squares[king], side, list(zip(codes, squares)), set(squares))
+
+
+def successor_names(name):
+    # Material signatures reachable from name by one capture or promotion
+    codes = table_codes(name)
+    names = set()
+    for index, code in enumerate(codes):
+        if code & TYPE_MASK == KING:
+            continue
+        names.add(canonical([(other, 0) for position, other in enumerate(codes) if position != index],
+                            WHITE)[0])
+        if code & TYPE_MASK == PAWN:
+            for promoted in (QUEEN,) + UNDERPROMOTIONS:
+                promoted_codes = list(codes)
+                promoted_codes[index] = (code & BLACK) | promoted
+                names.add(canonical([(other, 0) for other in promoted_codes], WHITE)[0])
+    return names - TRIVIAL_DRAWS
+
+
+def generate(name, directory=TABLE_DIR, verbose=False):
+    # Retrograde analysis: mates are found first, then every level of positions one ply
+    # further from mate is reached by unmaking moves from the level before. Captures and
+    # promotions lead into smaller tables, which must already exist
+    codes = table_codes(name)
+    count = len(codes)
+    size = 2 << (6 * count)
+    values = bytearray([UNKNOWN]) * size
+    remaining = bytearray(size)  # Moves within the table not yet known to lose
+    exit_wins = {}  # Plies to mate through the fastest winning capture or promotion
+    exit_losses = {}  # Plies to mate through the slowest losing capture or promotion
+    draw_exits = set()  # Positions with a capture or promotion that draws
+    levels = [[] for _ in range(ILLEGAL)]
+    kings = {WHITE: codes.index(WHITE | KING), BLACK: codes.index(BLACK | KING)}
+    started = time.time()
+
+    for index in range(size):
+        side = BLACK if index >> (6 * count) else WHITE
+        squares = [(index >> (6 * slot)) & 63 for slot in range(count)]
+        if not is_legal(codes, squares, side):
+            values[index] = ILLEGAL
+            continue
+        owners = {square: slot for slot, square in enumerate(squares)}
+        opponent = side ^ BLACK
+        moves = 0
+        for slot, code in enumerate(codes):
+            if code & BLACK != side:
+                continue
+            for target, captured in piece_moves(code, squares[slot], owners, codes):
+                child = list(squares)
+                child[slot] = target
+                promotions = ((QUEEN,) + UNDERPROMOTIONS if code & TYPE_MASK == PAWN and target // 8 in (0, 7)
+                              else (None,))
+                pieces = [(codes[other], child[other]) for other in range(count) if other != captured]
+                occupied = set(square for _, square in pieces)
+                if is_attacked(child[kings[side]], opponent, pieces, occupied):
+                    continue
+                for promoted in promotions:
+                    moves += 1
+                    if captured is None and promoted is None:
+                        remaining[index] += 1
+                        continue
+                    if promoted is not None:
+                        pieces = [(side | promoted if square == target else piece_code, square)
+                                  for piece_code, square in pieces]
+                    value = lookup(pieces, opponent, directory)
+                    if value is None:
+                        raise FileNotFoundError(table_path(canonical(pieces, opponent)[0], directory))
+                    if value == DRAW:
+                        draw_exits.add(index)
+                    elif (value - 1) % 2:
+                        exit_losses[index] = max(exit_losses.get(index, -1), value - 1)
+                    else:
+                        exit_wins[index] = min(exit_wins.get(index, ILLEGAL), value)
+        if index in exit_wins:
+            levels[exit_wins[index]].append(index)
+        elif not moves:
+            if is_attacked(squares[kings[side]], opponent, list(zip(codes, squares)), owners):
+                levels[0].append(index)
+        elif not remaining[index] and index not in draw_exits:
+            levels[exit_losses[index] + 1].append(index)
+    if verbose:
+        print(f'{name}: initial pass {time.time() - started:.1f}s')
+
+    for level in range(len(levels) - 1):
+        for index in levels[level]:
+            if values[index] != UNKNOWN:
+                continue
+            values[index] = level
+            side = BLACK if index >> (6 * count) else WHITE
+            mover = side ^ BLACK
+            squares = [(index >> (6 * slot)) & 63 for slot in range(count)]
+            occupied = set(squares)
+            for slot, code in enumerate(codes):
+                if code & BLACK != mover:
+                    continue
+                for source in piece_unmoves(code, squares[slot], occupied):
+                    parent_squares = list(squares)
+                    parent_squares[slot] = source
+                    parent = position_index(parent_squares, mover)
+                    if values[parent] != UNKNOWN:
+                        continue
+                    if level % 2 == 0:
+                        # A move into a lost position wins
+                        levels[level + 1].append(parent)
+                    else:
+                        remaining[parent] -= 1
+                        if not remaining[parent] and parent not in exit_wins and parent not in draw_exits:
+                            # Every move loses; the slowest one decides the distance
+                            levels[max(level, exit_losses.get(parent, -1)) + 1].append(parent)
+        levels[level] = None
+    if verbose:
+        print(f'{name}: done in {time.time() - started:.1f}s')
+
+    # Stored bytes: distance plus one, with unresolved (drawn) and illegal positions as DRAW
+    translation = bytes(DRAW if value >= ILLEGAL else value + 1 for value in range(256))
+    return bytes(values.translate(translation))
+
+
+def build_table(name, directory=TABLE_DIR, verbose=False):
+    # Writes the table for name, and first any missing tables it leads into
+    if name in TRIVIAL_DRAWS:
+        return None
+    codes = table_codes(name)
+    if len(codes) > MAX_PIECES or canonical([(code, 0) for code in codes], WHITE)[0] != name:
+        raise ValueError(f'not a supported material signature: {name}')
+    for successor in sorted(successor_names(name)):
+        if not os.path.exists(table_path(successor, directory)):
+            build_table(successor, directory, verbose)
+    data = generate(name, directory, verbose)
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(name, directory)
+    with open(path, 'wb') as table_file:
+        table_file.write(data)
+    stale = tables.pop(path, None)
+    if stale is not None:
+        stale.close()
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python tablebase.py MATERIAL...   e.g. KQK KRK KPK KBNK')
+        raise SystemExit(2)
+    for material in sys.argv[1:]:
+        build_table(material.upper(), verbose=True)
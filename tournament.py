@@ -0,0 +1,246 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ai
+from board import Board
+from book_builder import parse_coordinate_move
+from transposition import TranspositionTable
+from pieces import EMPTY, KING, KNIGHT, BISHOP, TYPE_MASK
+
+OPENINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openings.txt')
+OPENING_PLIES = 8  # Moves of each opening line played before the engines take over
+MAX_PLIES = 300  # Longer games are adjudicated drawn
+FIFTY_MOVE_PLIES = 100
+# A side whose own score stays this far below zero for RESIGN_PLIES of its moves loses
+RESIGN_SCORE = 60
+RESIGN_PLIES = 4
+# Both sides scoring within DRAW_SCORE of zero for DRAW_PLIES plies after DRAW_MIN_PLY is a draw
+DRAW_SCORE = 2
+DRAW_PLIES = 12
+DRAW_MIN_PLY = 80
+
+DEFAULT_ENGINE = {'name': 'engine', 'max_depth': ai.MAX_DEPTH, 'time_limit': None, 'hash_mb': ai.HASH_SIZE_MB,
+                  'settings': {}}
+# Settings that only feed defaults fixed when ai was loaded, moved to the engine's own keys
+SETTING_KEYS = {'MAX_DEPTH': 'max_depth', 'AI_TIME_LIMIT': 'time_limit', 'HASH_SIZE_MB': 'hash_mb'}
+# Settings a match cannot vary: games already run one per process, and the book opens once
+FIXED_SETTINGS = frozenset(('AI_WORKERS', 'BOOK_FILE'))
+
+
+def engine_config(spec):
+    # An engine is a name, search limits and overrides for ai's module settings,
+    # e.g. {"name": "no-lmr", "max_depth": 4, "settings": {"USE_LMR": false}}
+    config = dict(DEFAULT_ENGINE, **spec)
+    settings = dict(config['settings'])
+    for name in list(settings):
+        if not name.isupper() or not hasattr(ai, name) or name in FIXED_SETTINGS:
+            raise ValueError(f'unsupported engine setting: {name}')
+        if name in SETTING_KEYS:
+            key = SETTING_KEYS[name]
+            if key in spec and spec[key] != settings[name]:
+                raise ValueError(f'{name} conflicts with {key}')
+            config[key] = settings.pop(name)
+    config['settings'] = settings
+    return config
+
+
+def read_openings(path=OPENINGS_FILE, plies=OPENING_PLIES):
+    # FEN positions, or coordinate move lines cut to plies; returned as FEN strings
+    openings = []
+    with open(path) as openings_file:
+        for line in openings_file:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '/' in line:
+                openings.append(Board.from_fen(line).to_fen())
+                continue
+            board_obj = Board()
+            for text in line.split()[:plies]:
+                if not board_obj.move_piece(parse_coordinate_move(text), board_obj.turn):
+                    raise ValueError(f'illegal opening move {text}: {line}')
+            openings.append(board_obj.to_fen())
+    return openings
+
+
+def insufficient_material(board_obj):
+    # Bare kings, or a single knight or bishop beside them
+    pieces = [piece & TYPE_MASK for piece in board_obj.squares if piece != EMPTY and piece & TYPE_MASK != KING]
+    return not pieces or (len(pieces) == 1 and pieces[0] in (KNIGHT, BISHOP))
+
+
+class Engine:
+    # One side of a game: its settings and its own transposition table
+    def __init__(self, config):
+        self.config = config
+        self.table = TranspositionTable(config['hash_mb'])
+        self.defaults = {name: getattr(ai, name) for name in config['settings']}
+
+    def choose(self, board_obj, time_limit):
+        # Swaps this engine's settings and table into ai for the one search
+        saved_table = ai.transposition_table
+        ai.transposition_table = self.table
+        for name, value in self.config['settings'].items():
+            setattr(ai, name, value)
+        try:
+            return ai.get_ai_move(board_obj, board_obj.turn, time_limit, max_depth=self.config['max_depth'],
+                                  return_stats=True)
+        finally:
+            for name, value in self.defaults.items():
+                setattr(ai, name, value)
+            ai.transposition_table = saved_table
+
+
+def play_game(index, opening, white, black, clock=None, increment=0.0):
+    # Runs in a worker. Plays one game from the opening FEN and returns its record;
+    # clock gives each side that many seconds for the game, plus increment per move
+    ai.VERBOSE = False
+    ai.USE_BOOK = False  # The openings supply the variety
+    engines = {'white': Engine(white), 'black': Engine(black)}
+    remaining = {'white': clock, 'black': clock}
+    thinking = {'white': 0.0, 'black': 0.0}
+    board_obj = Board.from_fen(opening)
+    moves = []
+    losing_plies = {'white': 0, 'black': 0}
+    quiet_plies = 0
+    started = time.time()
+    result = reason = None
+
+    while result is None:
+        status = board_obj.status()
+        color = board_obj.turn
+        if status.checkmate:
+            result, reason = ('0-1' if color == 'white' else '1-0'), 'checkmate'
+        elif status.stalemate:
+            result, reason = '1/2-1/2', 'stalemate'
+        elif board_obj.is_threefold_repetition():
+            result, reason = '1/2-1/2', 'repetition'
+        elif board_obj.halfmove_clock >= FIFTY_MOVE_PLIES:
+            result, reason = '1/2-1/2', 'fifty moves'
+        elif insufficient_material(board_obj):
+            result, reason = '1/2-1/2', 'insufficient material'
+        elif len(moves) >= MAX_PLIES:
+            result, reason = '1/2-1/2', 'move limit'
+        if result is not None:
+            break
+
+        engine = engines[color]
+        time_limit = engine.config['time_limit']
+        if clock is not None:
+            budget = remaining[color] / 30 + increment
+            time_limit = budget if time_limit is None else min(time_limit, budget)
+        move_started = time.time()
+        move, stats = engine.choose(board_obj, time_limit)
+        elapsed = time.time() - move_started
+        thinking[color] += elapsed
+        if clock is not None:
+            remaining[color] -= elapsed
+            if remaining[color] < 0:
+                result, reason = ('0-1' if color == 'white' else '1-0'), 'time forfeit'
+                break
+            remaining[color] += increment
+
+        moves.append(board_obj.san(move))
+        if not board_obj.move_piece(move, color):
+            result, reason = ('0-1' if color == 'white' else '1-0'), 'illegal move'
+            break
+
+        # Adjudication on the mover's own score
+        score = stats.score if stats is not None else None
+        if score is not None:
+            losing_plies[color] = losing_plies[color] + 1 if score <= -RESIGN_SCORE else 0
+            if losing_plies[color] >= RESIGN_PLIES:
+                result, reason = ('0-1' if color == 'white' else '1-0'), 'adjudicated loss'
+            quiet_plies = quiet_plies + 1 if abs(score) <= DRAW_SCORE and len(moves) > DRAW_MIN_PLY else 0
+            if quiet_plies >= DRAW_PLIES:
+                result, reason = '1/2-1/2', 'adjudicated draw'
+
+    return {'game': index, 'opening': opening, 'white': white['name'], 'black': black['name'], 'result': result,
+            'reason': reason, 'plies': len(moves), 'seconds': round(time.time() - started, 3),
+            'white_seconds': round(thinking['white'], 3), 'black_seconds': round(thinking['black'], 3),
+            'moves': ' '.join(moves)}
+
+
+def elo_difference(wins, draws, losses):
+    # Elo of the first engine over the second with a 95% interval, from the per-game scores
+    games = wins + draws + losses
+    if not games:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def to_elo(fraction):
+        if fraction <= 0:
+            return -math.inf
+        if fraction >= 1:
+            return math.inf
+        return -400 * math.log10(1 / fraction - 1)
+    return to_elo(score), to_elo(score - margin), to_elo(score + margin)
+
+
+def run_match(first, second, openings, output_path, workers=None, rounds=1, clock=None, increment=0.0):
+    # Plays every opening twice per round, once with each engine as white, over a pool of
+    # processes. Game records are appended to output_path as they finish, followed by a
+    # summary record, which is also returned
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for _ in range(rounds):
+        for opening in openings:
+            tasks.append((opening, first, second))
+            tasks.append((opening, second, first))
+    tally = {'wins': 0, 'draws': 0, 'losses': 0}
+    started = time.time()
+    with open(output_path, 'a') as output, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(play_game, index, opening, white, black, clock, increment)
+                   for index, (opening, white, black) in enumerate(tasks)]
+        for future in as_completed(futures):
+            record = future.result()
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            if record['result'] == '1/2-1/2':
+                tally['draws'] += 1
+            elif (record['result'] == '1-0') == (record['white'] == first['name']):
+                tally['wins'] += 1
+            else:
+                tally['losses'] += 1
+        elo, low, high = elo_difference(tally['wins'], tally['draws'], tally['losses'])
+        summary = {'summary': f"{first['name']} vs {second['name']}", 'games': len(tasks), **tally,
+                   'elo': round(elo, 1), 'elo_low': round(low, 1), 'elo_high': round(high, 1),
+                   'seconds': round(time.time() - started, 1)}
+        output.write(json.dumps(summary) + '\n')
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play engine configurations against each other.')
+    parser.add_argument('first', help='JSON engine config, e.g. \'{"name": "a", "max_depth": 3}\'')
+    parser.add_argument('second', help='JSON engine config for the opponent')
+    parser.add_argument('--output', required=True, help='JSON lines file to append game records to')
+    parser.add_argument('--openings', default=OPENINGS_FILE, help='FEN or coordinate move lines')
+    parser.add_argument('--opening-plies', type=int, default=OPENING_PLIES)
+    parser.add_argument('--rounds', type=int, default=1, help='times to play each opening with both colours')
+    parser.add_argument('--workers', type=int, help='processes, default one per CPU')
+    parser.add_argument('--clock', type=float, help='seconds per side for the whole game')
+    parser.add_argument('--increment', type=float, default=0.0, help='seconds added per move')
+    args = parser.parse_args()
+    first = engine_config(json.loads(args.first))
+    second = engine_config(json.loads(args.second))
+    if first['name'] == second['name']:
+        parser.error('the two engines need different names')
+
+    summary = run_match(first, second, read_openings(args.openings, args.opening_plies), args.output,
+                        args.workers, args.rounds, args.clock, args.increment)
+    print(f"{summary['summary']}: +{summary['wins']} ={summary['draws']} -{summary['losses']}, "
+          f"Elo {summary['elo']:+.1f} [{summary['elo_low']:+.1f}, {summary['elo_high']:+.1f}] "
+          f"in {summary['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+from array import array
+from pieces import SQUARE_POS
+
+# Bound flags; 0 marks an empty slot
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# key (8) + score (4) + move (2) + depth, flag and age (1 each)
+ENTRY_BYTES = 17
+NO_MOVE = 0
+
+
+def encode_move(move):
+    # from << 6 | to, with an underpromotion's piece type in bits 12-14
+    if move is None:
+        return NO_MOVE
+    (start_row, start_col), (end_row, end_col) = move[0], move[1]
+    code = (start_row * 8 + start_col) << 6 | (end_row * 8 + end_col)
+    if len(move) > 2:
+        code |= move[2] << 12
+    return code
+
+
+def decode_move(code):
+    if code == NO_MOVE:
+        return None
+    move = (SQUARE_POS[code >> 6 & 63], SQUARE_POS[code & 63])
+    if code >> 12:
+        move += (code >> 12,)
+    return move
+
+
+class TranspositionTable:
+    # Fixed-size table of two-slot buckets: slot 0 keeps the deepest result of the
+    # current search, slot 1 always takes the newest one
+    def __init__(self, size_mb=16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.buckets = max(1, size_mb * 1024 * 1024 // (2 * ENTRY_BYTES))
+        slots = 2 * self.buckets
+        self.keys = array('Q', bytes(8 * slots))
+        self.scores = array('i', bytes(4 * slots))
+        self.moves = array('H', bytes(2 * slots))
+        self.depths = array('b', bytes(slots))
+        self.flags = array('B', bytes(slots))
+        self.ages = array('B', bytes(slots))
+        self.age = 0
+        self.reset_counters()
+
+    def clear(self):
+        self.resize(self.size_mb)
+
+    def reset_counters(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        # Returns (depth, score, flag, move) for the key, or None
+        self.probes += 1
+        slot = (key % self.buckets) * 2
+        for index in (slot, slot + 1):
+            if self.flags[index]:
+                if self.keys[index] == key:
+                    self.hits += 1
+                    return (self.depths[index], self.scores[index], self.flags[index],
+                            decode_move(self.moves[index]))
+                self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        slot = (key % self.buckets) * 2
+        if (self.keys[slot] == key or not self.flags[slot] or depth >= self.depths[slot]
+                or self.ages[slot] != self.age):
+            index = slot
+        else:
+            index = slot + 1
+        if self.flags[index] and self.keys[index] != key:
+            self.overwrites += 1
+        self.stores += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.flags[index] = flag
+        self.moves[index] = encode_move(move)
+        self.ages[index] = self.age
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def usage(self):
+        return sum(1 for flag in self.flags if flag) / len(self.flags)
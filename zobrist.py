@@ -0,0 +1,23 @@
+import random
+from pieces import EMPTY
+
+# Fixed seed so keys are identical in every process and across runs
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = tuple(tuple(_rng.getrandbits(64) for _ in range(64)) for _ in range(16))
+SIDE_KEY = _rng.getrandbits(64)
+CASTLING_KEYS = tuple(_rng.getrandbits(64) for _ in range(16))
+EN_PASSANT_KEYS = tuple(_rng.getrandbits(64) for _ in range(8))
+
+
+def compute_key(board_obj):
+    key = 0
+    for square, piece in enumerate(board_obj.squares):
+        if piece != EMPTY:
+            key ^= PIECE_KEYS[piece][square]
+    if board_obj.turn == 'black':
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[board_obj.castling_rights]
+    if board_obj.en_passant_target is not None:
+        key ^= EN_PASSANT_KEYS[board_obj.en_passant_target & 7]
+    return key